@@ -0,0 +1,580 @@
+"""
+Benchmarks for the helpers of minibelt, run them with:
+
+    python -m minibelt bench --help
+
+or:
+
+    python bench_minibelt.py bench --help
+
+This file is not part of the module, so it's not installed with it.
+"""
+
+import io
+import os
+import sys
+import json
+import shutil
+import tempfile
+
+from timeit import default_timer as timer
+from collections import deque
+from datetime import datetime, timedelta
+
+import minibelt
+from minibelt import (
+    slugify, Slugifier, normalize, normalize_stream, normalize_lines,
+    json_dumps, json_loads, dump_jsonl, iter_jsonl, iter_json_array,
+    import_from_path, lazy_import_from_path, resolve_lazy_import,
+    import_report, attr, compile_path, compile_attr_path, chunks, file_chunks,
+    window, rolling, rolling_sum, rolling_mean, rolling_var, rolling_min,
+    rolling_max, dmerge, get, subdict, subdict_view, iget, iget_many,
+    skip_duplicates, external_skip_duplicates, sset, IndexedSSet,
+    SortedIndexedSSet, unpack, add_to_pythonpath, write, write_lines, Writer,
+    read_lines, tail_lines, split_file, flatten, flatten_paths, unflatten,
+    instrument, stats, reset_stats
+)
+
+
+BENCH_SIZES = (10 ** 3, 10 ** 4, 10 ** 5)
+BENCH_THRESHOLD = 0.2
+
+# name in minibelt.__all__ -> function(size, tmpdir) preparing the data outside of
+# the timing, and returning a function to call to process `size` items
+BENCHMARKS = {}
+
+
+def benchmark(*names):
+    def decorator(func):
+        for name in names:
+            BENCHMARKS[name] = func
+        return func
+    return decorator
+
+
+def consume(iterable):
+    deque(iterable, maxlen=0)
+
+
+def bench_strings(size):
+    return ['H\xe9llo, W\xf3rld n\xb0%s !' % i for i in range(size)]
+
+
+def bench_records(size):
+    day = datetime(2000, 1, 1)
+    return [{'id': i, 'name': 'user%s' % i, 'date': day + timedelta(i % 1000),
+             'tags': ['a', 'b'], 'score': i / 3.} for i in range(size)]
+
+
+def bench_nested(size):
+    return [{'a': {'b': [i, {'c': i}]}, 'd': i} for i in range(size // 3)]
+
+
+def bench_file(size, tmpdir, name='lines.txt'):
+    path = os.path.join(tmpdir, '%s.%s' % (size, name))
+    if not os.path.exists(path):
+        write_lines(path, ('line %s' % i for i in range(size)))
+    return path
+
+
+@benchmark('slugify')
+def bench_slugify(size, tmpdir):
+    strings = bench_strings(size)
+    return lambda: consume(map(slugify, strings))
+
+
+@benchmark('Slugifier')
+def bench_slugifier(size, tmpdir):
+    strings = bench_strings(size)
+    return lambda: consume(Slugifier().slugify_many(strings))
+
+
+@benchmark('normalize')
+def bench_normalize(size, tmpdir):
+    strings = bench_strings(size)
+    return lambda: consume(map(normalize, strings))
+
+
+@benchmark('normalize_stream')
+def bench_normalize_stream(size, tmpdir):
+    strings = bench_strings(size)
+    return lambda: consume(normalize_stream(strings))
+
+
+@benchmark('normalize_lines')
+def bench_normalize_lines(size, tmpdir):
+    text = '\n'.join(bench_strings(size))
+    return lambda: consume(normalize_lines(io.StringIO(text)))
+
+
+@benchmark('json_dumps')
+def bench_json_dumps(size, tmpdir):
+    records = bench_records(size)
+    return lambda: json_dumps(records)
+
+
+@benchmark('json_loads')
+def bench_json_loads(size, tmpdir):
+    string = json_dumps(bench_records(size))
+    return lambda: json_loads(string)
+
+
+@benchmark('register_type')
+def bench_tagged(size, tmpdir):
+    records = bench_records(size)
+    return lambda: json_loads(json_dumps(records, tagged=True), tagged=True)
+
+
+@benchmark('dump_jsonl')
+def bench_dump_jsonl(size, tmpdir):
+    records = bench_records(size)
+    path = os.path.join(tmpdir, 'dump.jsonl')
+    return lambda: dump_jsonl(records, path)
+
+
+@benchmark('iter_jsonl')
+def bench_iter_jsonl(size, tmpdir):
+    path = os.path.join(tmpdir, '%s.jsonl' % size)
+    dump_jsonl(bench_records(size), path)
+    return lambda: consume(iter_jsonl(path))
+
+
+@benchmark('iter_json_array')
+def bench_iter_json_array(size, tmpdir):
+    string = json_dumps(bench_records(size))
+    return lambda: consume(iter_json_array(io.StringIO(string)))
+
+
+@benchmark('import_from_path')
+def bench_import_from_path(size, tmpdir):
+    paths = ['os.path.join', 'collections:OrderedDict.fromkeys'] * (size // 2)
+    return lambda: consume(map(import_from_path, paths))
+
+
+@benchmark('lazy_import_from_path')
+def bench_lazy_import_from_path(size, tmpdir):
+    def run():
+        for _ in range(size):
+            lazy_import_from_path('os.path').join
+    return run
+
+
+@benchmark('resolve_lazy_import')
+def bench_resolve_lazy_import(size, tmpdir):
+    proxies = [lazy_import_from_path('os.path.join') for _ in range(size)]
+    return lambda: consume(map(resolve_lazy_import, proxies))
+
+
+@benchmark('import_report')
+def bench_import_report(size, tmpdir):
+    def run():
+        for _ in range(size):
+            import_report()
+    return run
+
+
+def bench_objects(size):
+    class Node(object):
+        pass
+    objects = []
+    for i in range(size):
+        obj = Node()
+        obj.child = Node()
+        obj.child.value = i
+        objects.append(obj)
+    return objects
+
+
+@benchmark('attr')
+def bench_attr(size, tmpdir):
+    objects = bench_objects(size)
+
+    def run():
+        for obj in objects:
+            attr(obj, 'child', 'value')
+    return run
+
+
+@benchmark('compile_attr_path')
+def bench_compile_attr_path(size, tmpdir):
+    objects = bench_objects(size)
+    path = compile_attr_path('child.value')
+    return lambda: consume(map(path, objects))
+
+
+@benchmark('get')
+def bench_get(size, tmpdir):
+    data = bench_nested(size * 3)
+
+    def run():
+        for item in data:
+            get(item, 'a', 'b', 1, 'c')
+    return run
+
+
+@benchmark('compile_path')
+def bench_compile_path(size, tmpdir):
+    data = bench_nested(size * 3)
+    path = compile_path('a.b.1.c')
+    return lambda: consume(map(path, data))
+
+
+@benchmark('chunks')
+def bench_chunks(size, tmpdir):
+    data = list(range(size))
+    return lambda: consume(chunks(iter(data), 100))
+
+
+@benchmark('file_chunks')
+def bench_file_chunks(size, tmpdir):
+    data = b'x' * size
+    return lambda: consume(file_chunks(io.BytesIO(data), 1024))
+
+
+@benchmark('window')
+def bench_window(size, tmpdir):
+    data = list(range(size))
+    return lambda: consume(window(iter(data), 10))
+
+
+@benchmark('rolling')
+def bench_rolling(size, tmpdir):
+    data = [float(i % 97) for i in range(size)]
+    return lambda: consume(rolling(data, 10, 'mean'))
+
+
+def bench_rolling_aggregate(func):
+    def setup(size, tmpdir):
+        data = [float(i % 97) for i in range(size)]
+        return lambda: consume(func(data, 10))
+    return setup
+
+
+for _name, _func in (('rolling_sum', rolling_sum),
+                     ('rolling_mean', rolling_mean),
+                     ('rolling_var', rolling_var),
+                     ('rolling_min', rolling_min),
+                     ('rolling_max', rolling_max)):
+    BENCHMARKS[_name] = bench_rolling_aggregate(_func)
+del _name, _func
+
+
+@benchmark('dmerge')
+def bench_dmerge(size, tmpdir):
+    dicts = [{'a': {'b': i, i % 100: i}, i: i} for i in range(size)]
+    return lambda: dmerge(*dicts)
+
+
+@benchmark('subdict')
+def bench_subdict(size, tmpdir):
+    dct = dict.fromkeys(range(size), 1)
+    include = list(range(0, size, 2))
+    return lambda: subdict(dct, include)
+
+
+@benchmark('subdict_view')
+def bench_subdict_view(size, tmpdir):
+    dct = dict.fromkeys(range(size), 1)
+    include = list(range(0, size, 2))
+    return lambda: consume(subdict_view(dct, include).items())
+
+
+@benchmark('iget')
+def bench_iget(size, tmpdir):
+    return lambda: iget((i for i in range(size)), size - 1)
+
+
+@benchmark('iget_many')
+def bench_iget_many(size, tmpdir):
+    indices = list(range(0, size, 10)) + [-1]
+    return lambda: iget_many((i for i in range(size)), indices)
+
+
+@benchmark('unpack')
+def bench_unpack(size, tmpdir):
+    data = bench_nested(size * 3)
+
+    def run():
+        for item in data:
+            unpack(item, 'a.b.0', 'd', paths=True, as_tuple=True)
+    return run
+
+
+@benchmark('skip_duplicates')
+def bench_skip_duplicates(size, tmpdir):
+    data = [i % (size // 2 or 1) for i in range(size)]
+    return lambda: consume(skip_duplicates(data))
+
+
+@benchmark('external_skip_duplicates')
+def bench_external_skip_duplicates(size, tmpdir):
+    data = [i % (size // 2 or 1) for i in range(size)]
+    return lambda: consume(external_skip_duplicates(data, tmpdir=tmpdir))
+
+
+def bench_sset_type(cls):
+    def setup(size, tmpdir):
+        data = [(i * 7919) % size for i in range(size)]
+
+        def run():
+            items = cls(data)
+            for i in data:
+                i in items
+        return run
+    return setup
+
+
+BENCHMARKS['sset'] = bench_sset_type(sset)
+BENCHMARKS['IndexedSSet'] = bench_sset_type(IndexedSSet)
+BENCHMARKS['SortedIndexedSSet'] = bench_sset_type(SortedIndexedSSet)
+
+
+@benchmark('add_to_pythonpath')
+def bench_add_to_pythonpath(size, tmpdir):
+    def run():
+        path = list(sys.path)
+        try:
+            for _ in range(size):
+                add_to_pythonpath(tmpdir)
+        finally:
+            sys.path[:] = path
+    return run
+
+
+@benchmark('write')
+def bench_write(size, tmpdir):
+    lines = bench_strings(size)
+    path = os.path.join(tmpdir, 'write.txt')
+    return lambda: write(path, *lines)
+
+
+@benchmark('write_lines')
+def bench_write_lines(size, tmpdir):
+    lines = bench_strings(size)
+    path = os.path.join(tmpdir, 'write.txt')
+    return lambda: write_lines(path, iter(lines))
+
+
+@benchmark('Writer')
+def bench_writer(size, tmpdir):
+    lines = bench_strings(size)
+    path = os.path.join(tmpdir, 'write.txt')
+
+    def run():
+        with Writer(path, atomic=True) as writer:
+            for line in lines:
+                writer.write(line)
+    return run
+
+
+@benchmark('read_lines')
+def bench_read_lines(size, tmpdir):
+    path = bench_file(size, tmpdir)
+    return lambda: consume(read_lines(path))
+
+
+@benchmark('tail_lines')
+def bench_tail_lines(size, tmpdir):
+    path = bench_file(size, tmpdir)
+    return lambda: tail_lines(path, size // 10)
+
+
+@benchmark('split_file')
+def bench_split_file(size, tmpdir):
+    path = bench_file(size, tmpdir)
+    return lambda: split_file(path, size // 100 or 1)
+
+
+@benchmark('flatten')
+def bench_flatten(size, tmpdir):
+    data = [[i, (i, [i])] for i in range(size // 3)]
+    return lambda: consume(flatten(data))
+
+
+@benchmark('flatten_paths')
+def bench_flatten_paths(size, tmpdir):
+    data = bench_nested(size)
+    return lambda: consume(flatten_paths(data))
+
+
+@benchmark('unflatten')
+def bench_unflatten(size, tmpdir):
+    flat = list(flatten_paths(bench_nested(size)))
+    return lambda: unflatten(flat)
+
+
+@benchmark('instrument')
+def bench_instrument(size, tmpdir):
+    strings = bench_strings(size)
+
+    def run():
+        instrument(names=['slugify'])
+        try:
+            consume(map(minibelt.slugify, strings))
+        finally:
+            instrument(False)
+            reset_stats()
+    return run
+
+
+@benchmark('stats', 'reset_stats')
+def bench_stats(size, tmpdir):
+    def run():
+        instrument()
+        try:
+            for _ in range(size):
+                stats()
+                reset_stats()
+        finally:
+            instrument(False)
+    return run
+
+
+def run_benchmarks(names=None, sizes=BENCH_SIZES, repeat=3, report=None):
+    """
+        Run the benchmarks of the given names from __all__, or all of them,
+        for each of the `sizes`, and returns a dict of results such as:
+
+            {
+                'chunks': {
+                    '1000': {'ops_per_sec': 2.1e7, 'peak_memory': 1544},
+                    ...
+                },
+                ...
+            }
+
+        'ops_per_sec' is the number of items processed per second for the
+        best of `repeat` runs. 'peak_memory' is in bytes, as measured by
+        tracemalloc during an additional run. Names without a benchmark, such
+        as constants, are skipped. `report` is called with (name, size, result)
+        after each benchmark.
+    """
+    import tracemalloc
+
+    results = {}
+    tmpdir = tempfile.mkdtemp(prefix='minibelt-bench-')
+    try:
+        for name in names or minibelt.__all__:
+            setup = BENCHMARKS.get(name)
+            if setup is None or not hasattr(minibelt, name):
+                continue
+            results[name] = {}
+            for size in sizes:
+                run = setup(size, tmpdir)
+
+                best = float('inf')
+                for _ in range(repeat):
+                    start = timer()
+                    run()
+                    best = min(best, timer() - start)
+
+                tracemalloc.start()
+                try:
+                    run()
+                    peak = tracemalloc.get_traced_memory()[1]
+                finally:
+                    tracemalloc.stop()
+
+                result = results[name][str(size)] = {
+                    'ops_per_sec': size / best if best else float('inf'),
+                    'peak_memory': peak,
+                }
+                if report:
+                    report(name, size, result)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    return results
+
+
+def compare_benchmarks(results, baseline, threshold=BENCH_THRESHOLD):
+    """
+        Return a list of (name, size, baseline ops/sec, ops/sec) for each
+        benchmark that is more than `threshold` (a ratio) slower than in
+        `baseline`. Benchmarks missing from one of them are ignored.
+
+        :Example:
+
+            >>> old = {'get': {'1000': {'ops_per_sec': 100.}}}
+            >>> new = {'get': {'1000': {'ops_per_sec': 70.}}}
+            >>> compare_benchmarks(new, old, threshold=0.2)
+            [('get', '1000', 100.0, 70.0)]
+            >>> compare_benchmarks(new, old, threshold=0.5)
+            []
+    """
+    regressions = []
+    for name, by_size in sorted(results.items()):
+        for size, result in sorted(by_size.items(), key=lambda x: int(x[0])):
+            try:
+                before = baseline[name][size]['ops_per_sec']
+            except KeyError:
+                continue
+            after = result['ops_per_sec']
+            if after < before * (1 - threshold):
+                regressions.append((name, size, before, after))
+    return regressions
+
+
+def main(argv=None):
+    """
+        Command line entry point: "python -m minibelt bench --help"
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='python -m minibelt')
+    commands = parser.add_subparsers(dest='command')
+    bench = commands.add_parser('bench', help='run the benchmarks')
+    bench.add_argument('names', nargs='*', metavar='NAME',
+                       help='names from __all__ to benchmark, default to all')
+    bench.add_argument('--sizes', default=','.join(map(str, BENCH_SIZES)),
+                       help='comma separated numbers of items, like 1e3,1e7')
+    bench.add_argument('--repeat', type=int, default=3,
+                       help='number of runs to keep the best of')
+    bench.add_argument('--output', help='save the results in this JSON file')
+    bench.add_argument('--baseline',
+                       help='JSON file of previous results to compare to')
+    bench.add_argument('--threshold', type=float, default=BENCH_THRESHOLD,
+                       help='slowdown ratio considered a regression')
+
+    args = parser.parse_args(argv)
+    if args.command != 'bench':
+        parser.print_help()
+        return 2
+
+    unknown = [name for name in args.names if name not in minibelt.__all__]
+    if unknown:
+        parser.error('unknown names: %s' % ', '.join(unknown))
+
+    names = args.names or minibelt.__all__
+    skipped = [name for name in names
+               if name not in BENCHMARKS or not hasattr(minibelt, name)]
+    sizes = [int(float(size)) for size in args.sizes.split(',')]
+
+    def report(name, size, result):
+        print('%-26s %10d %14.0f ops/s %12d B' % (
+              name, size, result['ops_per_sec'], result['peak_memory']))
+        sys.stdout.flush()
+
+    results = run_benchmarks(names, sizes, args.repeat, report)
+    if skipped:
+        print('Skipped: %s' % ', '.join(skipped))
+
+    if args.output:
+        with io.open(args.output, 'w', encoding='utf8') as f:
+            f.write(json.dumps({
+                'version': minibelt.__version__,
+                'python': sys.version.split()[0],
+                'results': results,
+            }, indent=2, sort_keys=True))
+
+    if not args.baseline:
+        return 0
+
+    with io.open(args.baseline, encoding='utf8') as f:
+        baseline = json.load(f)
+    regressions = compare_benchmarks(results, baseline.get('results', baseline),
+                                     args.threshold)
+    for name, size, before, after in regressions:
+        print('REGRESSION %s (%s items): %.0f -> %.0f ops/s (%+.0f%%)' % (
+              name, size, before, after, (after / before - 1) * 100))
+    return 1 if regressions else 0
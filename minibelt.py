@@ -11,121 +11,366 @@ It's under zlib licence.
 
 """
 
-from __future__ import unicode_literals
-
-
+import io
 import os
 import re
 import sys
 import json
 import unicodedata
 import codecs
+import base64
+import math
+import heapq
+import inspect
+import pickle
+import shutil
+import tempfile
+import threading
 
 from itertools import islice, chain
-from collections import deque
+from bisect import bisect_left, bisect_right, insort
+from operator import itemgetter, attrgetter, ge, le
+from functools import lru_cache, wraps
+from timeit import default_timer as timer
+from collections import deque, OrderedDict
 from datetime import datetime, timedelta, date, time
+from decimal import Decimal
+from uuid import UUID
+from array import array
+from mmap import mmap, ACCESS_READ
 
-try:
-    from collections.abc import MutableSet
-except ImportError:
-    from collections import MutableSet
+from collections.abc import (MutableSet, Mapping, MutableMapping, Sequence,
+                             Set, Iterator)
 
 
 __version__ = '0.2.2'
 
 __all__ = [
-'slugify', 'normalize', 'json_dumps', 'json_loads', 'CLASSIC_DATETIME_FORMAT',
-'to_timestamp', 'import_from_path', 'attr', 'chunks', 'window', 'dmerge',
-'get', 'subdict', 'iget', 'skip_duplicates', 'sset', 'unpack',
-'add_to_pythonpath', 'write', 'flatten'
+'slugify', 'Slugifier', 'normalize', 'normalize_stream', 'normalize_lines',
+'json_dumps', 'json_loads', 'dump_jsonl', 'iter_jsonl', 'iter_json_array',
+'register_type', 'CLASSIC_DATETIME_FORMAT', 'to_timestamp', 'import_from_path',
+'lazy_import_from_path', 'resolve_lazy_import', 'import_report', 'attr',
+'compile_path', 'compile_attr_path', 'chunks', 'file_chunks', 'window',
+'rolling', 'rolling_sum', 'rolling_mean', 'rolling_var', 'rolling_min',
+'rolling_max', 'dmerge', 'get', 'subdict', 'subdict_view', 'iget', 'iget_many',
+'skip_duplicates', 'external_skip_duplicates', 'sset', 'IndexedSSet',
+'SortedIndexedSSet', 'unpack', 'add_to_pythonpath', 'write', 'write_lines',
+'Writer', 'read_lines', 'tail_lines', 'split_file', 'flatten', 'flatten_paths',
+'unflatten', 'instrument', 'stats', 'reset_stats'
 ]
 
 CLASSIC_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
 CLASSIC_DATETIME_PATTERN = r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{6}'
 
-# for P3K compat
-try:
-    unicode
-except NameError:
-    unicode = str
-    xrange = range
+_NOTHING = object()  # sentinel for when None is a valid value
 
 try:
     import unidecode
 
-    def slugify(string, separator=r'-'):
-        r"""
-        Slugify a unicode string using unidecode to normalize the string.
+    def transliterate(char):
+        """
+            Returns the closest ASCII counter part of a single character,
+            using unidecode.
+        """
+        return unidecode.unidecode(char)
 
-        :Example:
 
-            >>> slugify(u"H\xe9ll\xf8 W\xf3rld")
-            'hello-world'
-            >>> slugify("Bonjour, tout l'monde !", separator="_")
-            'bonjour_tout_lmonde'
-            >>> slugify("\tStuff with -- dashes and...   spaces   \n")
-            'stuff-with-dashes-and-spaces'
+except ImportError:
+
+    def transliterate(char):
         """
-        string = normalize(string)
-        string = re.sub(r'[^\w\s' + separator + ']', '',  string, flags=re.U)
-        string = string.strip().lower()
-        return re.sub(r'[' + separator + '\s]+', separator, string, flags=re.U)
+            Returns the closest ASCII counter part of a single character,
+            using unicodedata. This gives limited yet useful results.
+        """
+        char = unicodedata.normalize('NFKD', char).encode('ascii', 'ignore')
+        return char.decode('ascii')
 
 
-    def normalize(string):
-        r"""
-            Returns a new string withou non ASCII characters, trying to replace
-            them with their ASCII closest counter parts when possible.
+try:
+    _isascii = str.isascii
+except AttributeError:
+    _non_ascii = re.compile(r'[^\x00-\x7f]').search
 
-            :Example:
+    def _isascii(string):
+        return not _non_ascii(string)
 
-                >>> normalize(u"H\xe9ll\xf8 W\xf3rld")
-                'Hello World'
 
-            This version use unidecode and provide enhanced results.
-        """
-        return unidecode.unidecode(string)
+class TransliterationTable(dict):
+    """
+        Mapping from code points to their ASCII replacement that can be
+        passed to str.translate().
 
+        It's filled lazily: the first time a code point is looked up,
+        transliterate() is called on it and the result is kept for the
+        next calls.
+    """
 
-except ImportError:
+    def __init__(self):
+        super(TransliterationTable, self).__init__((i, i) for i in range(128))
 
-    def normalize(string):
-        r"""
-            Returns a new string withou non ASCII characters, trying to replace
-            them with their ASCII closest counter parts when possible.
+    def __missing__(self, codepoint):
+        self[codepoint] = value = transliterate(chr(codepoint))
+        return value
 
-            :Example:
 
-                >>> normalize(u"H\xe9ll\xf8 W\xc3\xb6rld")
-                'Hell World'
+_transliteration_table = None
 
 
-            This version use unicodedata and provide limited yet
-            useful results.
-        """
-        string = unicodedata.normalize('NFKD', string).encode('ascii', 'ignore')
-        return string.decode('ascii')
+def get_transliteration_table():
+    """
+        Returns the TransliterationTable shared by all calls to normalize(),
+        creating it on the first call.
+    """
+    global _transliteration_table
+    if _transliteration_table is None:
+        _transliteration_table = TransliterationTable()
+    return _transliteration_table
+
+
+def normalize(string):
+    r"""
+        Returns a new string withou non ASCII characters, trying to replace
+        them with their ASCII closest counter parts when possible.
+
+        :Example:
+
+            >>> normalize(u"H\xe9llo W\xf3rld")
+            'Hello World'
+
+        If unidecode is installed, it's used to provide enhanced results.
+        Otherwise unicodedata is used and provides limited yet useful
+        results: u"\xf8" is just removed instead of being turned into "o".
+
+        ASCII strings are returned as-is, and other strings are translated
+        with a table caching the replacement of each character.
+    """
+    if _isascii(string):
+        return string
+    return string.translate(get_transliteration_table())
+
+
+def normalize_stream(iterable):
+    r"""
+        Returns a lazy iterator yielding normalize() applied to each string
+        of `iterable`.
+
+        :Example:
+
+            >>> list(normalize_stream([u"H\xe9llo", u"W\xf3rld"]))
+            ['Hello', 'World']
+    """
+    return map(normalize, iterable)
+
+
+def normalize_lines(fileobj, encoding='utf8', errors='strict'):
+    r"""
+        Returns a lazy iterator yielding each line of the file object,
+        normalized. Line endings are kept.
 
+        If the file is opened in binary mode, lines are decoded using
+        `encoding` and `errors` first.
+
+        :Example:
+
+            >>> import io
+            >>> list(normalize_lines(io.StringIO(u"H\xe9llo\nW\xf3rld\n")))
+            ['Hello\n', 'World\n']
+    """
+    for line in fileobj:
+        if isinstance(line, bytes):
+            line = line.decode(encoding, errors)
+        yield normalize(line)
 
-    def slugify(string, separator=r'-'):
-        r"""
-        Slugify a unicode string using unicodedata to normalize the string.
+
+class Slugifier(object):
+    r"""
+        Callable turning unicode strings into slugs, with all the regexes
+        and tables computed once at creation instead of on every call.
+
+        Use it instead of slugify() when you need to process a lot of
+        strings with the same separator.
 
         :Example:
 
-            >>> slugify(u"H\xe9ll\xf8 W\xc3\xb6rld")
-            'hell-world'
-            >>> slugify("Bonjour, tout l'monde !", separator="_")
+            >>> slugifier = Slugifier(separator='_')
+            >>> slugifier("Bonjour, tout l'monde !")
             'bonjour_tout_lmonde'
-            >>> slugify("\tStuff with -- dashes and...   spaces   \n")
-            'stuff-with-dashes-and-spaces'
-        """
+            >>> list(slugifier.slugify_many(['Foo Bar', ' Baz ']))
+            ['foo_bar', 'baz']
 
-        string = normalize(string)
-        string = re.sub(r'[^\w\s' + separator + ']', '', string, flags=re.U)
+        If you often get the same inputs, you can pass `cache_size` to keep
+        the last results in a bounded LRU cache :
+
+            >>> slugifier = Slugifier(cache_size=1000)
+            >>> slugifier("Foo Bar")
+            'foo-bar'
+
+        The string is first passed to normalize(), so installing unidecode
+        will give you better results.
+    """
+
+    def __init__(self, separator='-', cache_size=None):
+        self.separator = separator
+        self.cache_size = cache_size
+
+        escaped = re.escape(separator)
+        self.collapse_pattern = re.compile(r'[' + escaped + r'\s]+', re.U)
+
+        # normalize() only outputs ASCII, so deleting the ASCII characters
+        # that are not \w, \s or part of the separator is enough
+        keep = re.compile(r'[\w\s' + escaped + r']', re.U)
+        self.strip_table = dict((i, None) for i in range(128)
+                                if not keep.match(chr(i)))
+
+        if cache_size:
+            self._slugify = lru_cache(maxsize=cache_size)(self._slugify)
+
+
+    def _slugify(self, string):
+        string = normalize(string).translate(self.strip_table)
         string = string.strip().lower()
-        return re.sub(r'[' + separator + '\s]+', separator, string, flags=re.U)
+        return self.collapse_pattern.sub(self.separator, string)
+
+
+    def __call__(self, string):
+        return self._slugify(string)
+
+
+    def slugify_many(self, iterable):
+        """
+            Returns a lazy iterator yielding the slug of each string in
+            `iterable`.
+        """
+        return map(self._slugify, iterable)
+
 
+_slugifiers = {}
+
+
+def slugify(string, separator=r'-'):
+    r"""
+    Slugify a unicode string using normalize().
+
+    :Example:
+
+        >>> slugify(u"H\xe9llo W\xf3rld")
+        'hello-world'
+        >>> slugify("Bonjour, tout l'monde !", separator="_")
+        'bonjour_tout_lmonde'
+        >>> slugify("\tStuff with -- dashes and...   spaces   \n")
+        'stuff-with-dashes-and-spaces'
+
+    You get better results if you install unidecode. This is a wrapper
+    around a Slugifier instance, created once per separator.
+    """
+    try:
+        slugifier = _slugifiers[separator]
+    except KeyError:
+        slugifier = _slugifiers[separator] = Slugifier(separator)
+    return slugifier._slugify(string)
+
+
+
+try:
+    _parse_datetime = datetime.fromisoformat
+    _parse_date = date.fromisoformat
+    _parse_time = time.fromisoformat
+except AttributeError:
+    def _parse_datetime(string):
+        # the tagged encoders always write microseconds, but isoformat()
+        # puts a "T" between the date and the time
+        return datetime.strptime(string.replace('T', ' ', 1),
+                                 CLASSIC_DATETIME_FORMAT)
+
+    def _parse_date(string):
+        return _parse_datetime(string + ' 00:00:00.000000').date()
+
+    def _parse_time(string):
+        return _parse_datetime('1900-01-01 ' + string).time()
+
+
+JSON_TYPE_KEY = '__type__'
+JSON_VALUE_KEY = 'value'
+
+_json_type_encoders = {}
+_json_type_decoders = {}
+_json_type_encoders_cache = {}
+
+
+def register_type(cls, encode, decode, tag=None):
+    """
+        Register how to serialize instances of `cls` when JSONEncoder and
+        JSONDecoder are used with `tagged=True`.
+
+        `encode` must turn the object into something JSON can serialize,
+        and `decode` must turn it back into the original object. The
+        object is written as {"__type__": tag, "value": encode(obj)},
+        `tag` defaulting to the class name.
+
+        :Example:
+
+            >>> from fractions import Fraction
+            >>> register_type(Fraction, lambda f: [f.numerator, f.denominator],
+            ...               lambda v: Fraction(*v))
+            >>> json_dumps({'a': Fraction(1, 3)}, tagged=True)
+            '{"a": {"__type__": "Fraction", "value": [1, 3]}}'
+            >>> json_loads(_, tagged=True)
+            {'a': Fraction(1, 3)}
+
+        Subclasses of `cls` are encoded with the same callback, unless
+        they are registered too.
+    """
+    tag = tag or cls.__name__
+    _json_type_encoders[cls] = (tag, encode)
+    _json_type_decoders[tag] = decode
+    _json_type_encoders_cache.clear()
+
+
+def _find_in_mro(mapping, cls):
+    for parent in cls.__mro__:
+        if parent in mapping:
+            return mapping[parent]
+    return None
+
+
+def _tagged_encoder(cls):
+    try:
+        return _json_type_encoders_cache[cls]
+    except KeyError:
+        pass
+
+    tag_and_encode = _find_in_mro(_json_type_encoders, cls)
+    if tag_and_encode is None:
+        encoder = None
+    else:
+        tag, encode = tag_and_encode
+
+        def encoder(obj):
+            return {JSON_TYPE_KEY: tag, JSON_VALUE_KEY: encode(obj)}
+
+    _json_type_encoders_cache[cls] = encoder
+    return encoder
+
+
+# microseconds are always written so that the strptime() fallback used
+# before Python 3.7 can read them back
+register_type(datetime,
+              lambda dt: dt.isoformat(timespec='microseconds'),
+              _parse_datetime)
+register_type(date, date.isoformat, _parse_date)
+register_type(time,
+              lambda t: t.isoformat(timespec='microseconds'),
+              _parse_time)
+register_type(timedelta,
+              lambda td: [td.days, td.seconds, td.microseconds],
+              lambda value: timedelta(*value))
+register_type(Decimal, str, Decimal)
+register_type(UUID, str, UUID)
+register_type(set, list, set)
+register_type(frozenset, list, frozenset)
+register_type(bytes,
+              lambda b: base64.b64encode(b).decode('ascii'),
+              base64.b64decode)
 
 
 class JSONEncoder(json.JSONEncoder):
@@ -134,6 +379,12 @@ class JSONEncoder(json.JSONEncoder):
 
         You should use naive datetime only. If you have timezone information,
         store them in a separate field.
+
+        If you pass `tagged=True`, types registered with register_type()
+        are written as {"__type__": tag, "value": ...} instead, which
+        JSONDecoder(tagged=True) can read back without guessing. Datetime,
+        date, time, timedelta, Decimal, UUID, set, frozenset and bytes are
+        registered by default.
     """
 
     DATETIME_FORMAT = CLASSIC_DATETIME_FORMAT
@@ -142,35 +393,66 @@ class JSONEncoder(json.JSONEncoder):
 
 
     def __init__(self, datetime_format=None, date_format=None, time_format=None,
-                timedelta_format=None, *args, **kwargs):
+                timedelta_format=None, tagged=False, *args, **kwargs):
 
         self.datetime_format = datetime_format or self.DATETIME_FORMAT
         self.date_format = date_format or self.DATE_FORMAT
         self.time_format = time_format or self.TIME_FORMAT
         self.timedelta_format = timedelta_format or self.TIMEDELTA_FORMAT
+        self.tagged = tagged
+        self.formatters = {
+            datetime: self.format_datetime,
+            date: self.format_date,
+            time: self.format_time,
+            timedelta: self.format_timedelta,
+        }
+        self._formatters_cache = {}
         super(JSONEncoder, self).__init__(*args, **kwargs)
 
 
-    def default(self, obj):
+    def format_datetime(self, obj):
+        return obj.strftime(self.datetime_format)
+
+    def format_date(self, obj):
+        return obj.strftime(self.date_format)
+
+    def format_time(self, obj):
+        return obj.strftime(self.time_format)
+
+    def format_timedelta(self, obj):
+        return self.timedelta_format % obj.total_seconds()
+
 
-        if isinstance(obj, datetime):
-            return obj.strftime(self.datetime_format)
+    def default(self, obj):
 
-        if isinstance(obj, date):
-            return obj.strftime(self.date_format)
+        cls = obj.__class__
 
-        if isinstance(obj, time):
-            return obj.strftime(self.time_format)
+        if self.tagged:
+            encode = _tagged_encoder(cls)
+        else:
+            try:
+                encode = self._formatters_cache[cls]
+            except KeyError:
+                encode = _find_in_mro(self.formatters, cls)
+                self._formatters_cache[cls] = encode
 
-        if isinstance(obj, timedelta):
-            return self.timedelta_format % obj.total_seconds()
+        if encode is None:
+            return json.JSONEncoder.default(self, obj)
 
-        return json.JSONEncoder.default(self, obj)
+        return encode(obj)
 
 
 class JSONDecoder(json.JSONDecoder):
     """
         Json decoder that decode JSON encoded with JSONEncoder
+
+        Use `tagged=True` to read JSON written with JSONEncoder(tagged=True):
+        objects are then recognized by their tag, and strings are never
+        inspected.
+
+        Only strings that are values in JSON objects are decoded. If you
+        know which keys can contain dates, pass them as `date_keys` and
+        the values of the other keys won't be inspected at all.
     """
 
     DATETIME_PATTERN = CLASSIC_DATETIME_PATTERN
@@ -180,45 +462,109 @@ class JSONDecoder(json.JSONDecoder):
 
     def __init__(self, datetime_pattern=None, date_pattern=None,
                 time_pattern=None, timedelta_pattern=None, datetime_format=None,
-                date_format=None, time_format=None, *args, **kwargs):
+                date_format=None, time_format=None, date_keys=None,
+                tagged=False, *args, **kwargs):
 
         self.datetime_format = datetime_format or JSONEncoder.DATETIME_FORMAT
         self.date_format = date_format or JSONEncoder.DATE_FORMAT
         self.time_format = time_format or JSONEncoder.TIME_FORMAT
 
-        self.datetime_pattern = re.compile(datetime_pattern or self.DATETIME_PATTERN)
-        self.date_pattern = re.compile(date_pattern or self.DATE_PATTERN)
-        self.time_pattern = re.compile(time_pattern or self.TIME_PATTERN)
-        self.timedelta_pattern = re.compile(timedelta_pattern or self.TIMEDELTA_PATTERN)
+        datetime_pattern = datetime_pattern or self.DATETIME_PATTERN
+        date_pattern = date_pattern or self.DATE_PATTERN
+        time_pattern = time_pattern or self.TIME_PATTERN
+        timedelta_pattern = timedelta_pattern or self.TIMEDELTA_PATTERN
+
+        # with the default formats, the length and a few characters are
+        # enough to know which pattern to try, and fromisoformat() can
+        # parse the result
+        self.fast_path = (
+            (datetime_pattern, date_pattern, time_pattern, timedelta_pattern,
+             self.datetime_format, self.date_format, self.time_format) ==
+            (CLASSIC_DATETIME_PATTERN, JSONDecoder.DATE_PATTERN,
+             JSONDecoder.TIME_PATTERN, JSONDecoder.TIMEDELTA_PATTERN,
+             JSONEncoder.DATETIME_FORMAT, JSONEncoder.DATE_FORMAT,
+             JSONEncoder.TIME_FORMAT)
+        )
+        flags = re.ASCII if self.fast_path else 0
+
+        self.datetime_pattern = re.compile(datetime_pattern, flags)
+        self.date_pattern = re.compile(date_pattern, flags)
+        self.time_pattern = re.compile(time_pattern, flags)
+        self.timedelta_pattern = re.compile(timedelta_pattern, flags)
+
+        self.date_keys = None if date_keys is None else frozenset(date_keys)
+
+        self.tagged = tagged
+        if tagged:
+            hook = self.tagged_object_pairs_hook
+        else:
+            hook = self.object_pairs_hook
 
-        super(JSONDecoder, self).__init__(object_pairs_hook=self.object_pairs_hook,
-                                          *args, **kwargs)
+        super(JSONDecoder, self).__init__(object_pairs_hook=hook, *args, **kwargs)
 
     def object_pairs_hook(self, obj):
-        return dict((k, self.decode_on_match(v)) for k, v in obj)
+        decode = self.decode_on_match
+        date_keys = self.date_keys
+        if date_keys is None:
+            return {k: decode(v) for k, v in obj}
+        return {k: decode(v) if k in date_keys else v for k, v in obj}
+
+
+    def tagged_object_pairs_hook(self, obj):
+        if (len(obj) == 2 and obj[0][0] == JSON_TYPE_KEY and
+                obj[1][0] == JSON_VALUE_KEY):
+            try:
+                decode = _json_type_decoders[obj[0][1]]
+            except (KeyError, TypeError):
+                pass
+            else:
+                return decode(obj[1][1])
+        return dict(obj)
 
 
     def decode_on_match(self, obj):
         """
             Try to match the string, and if it fits any date format,
             parse it and returns a Python object.
+
+            Anything that is not a string is returned as-is.
         """
 
-        string = unicode(obj)
+        if not isinstance(obj, str):
+            return obj
 
-        match = re.search(self.datetime_pattern, string)
-        if match:
-            return datetime.strptime(match.string, self.datetime_format)
+        if self.fast_path:
+            size = len(obj)
 
-        match = re.search(self.date_pattern, string)
-        if match:
-            return datetime.strptime(match.string, self.date_format).date()
+            if size == 26:
+                if obj[10] == ' ' and self.datetime_pattern.fullmatch(obj):
+                    return _parse_datetime(obj)
 
-        match = re.search(self.time_pattern, string)
-        if match:
-            return datetime.strptime(match.string, self.time_format).time()
+            elif size == 10:
+                if obj[4] == '-' and self.date_pattern.fullmatch(obj):
+                    return _parse_date(obj)
+
+            elif size == 15:
+                if obj[2] == ':' and self.time_pattern.fullmatch(obj):
+                    return _parse_time(obj)
+
+            elif obj.startswith('timedelta('):
+                match = self.timedelta_pattern.fullmatch(obj)
+                if match:
+                    return timedelta(seconds=float(match.group('seconds')))
+
+            return obj
+
+        if self.datetime_pattern.fullmatch(obj):
+            return datetime.strptime(obj, self.datetime_format)
+
+        if self.date_pattern.fullmatch(obj):
+            return datetime.strptime(obj, self.date_format).date()
 
-        match = re.search(self.timedelta_pattern, string)
+        if self.time_pattern.fullmatch(obj):
+            return datetime.strptime(obj, self.time_format).time()
+
+        match = self.timedelta_pattern.fullmatch(obj)
         if match:
             return timedelta(seconds=float(match.groupdict()['seconds']))
 
@@ -264,10 +610,17 @@ def json_loads(string, datetime_pattern=None, date_pattern=None,
             {'test': datetime.date(2000, 1, 1)}
             >>> json_loads('{"test": "01:01:01.000000"}')
             {'test': datetime.time(1, 1, 1)}
-            >>> json_loads('{"test": "timedelta(seconds=\'86401.0\')"}')
-            {'test': datetime.timedelta(1, 1)}
-            >>> json_loads('{"test": "timedelta(seconds=\'86401.0\')", "a": [1, 2]}')
-            {'test': datetime.timedelta(1, 1), 'a': [1, 2]}
+            >>> json_loads('{"test": "timedelta(seconds=\'86401.0\')"}') == {
+            ...     'test': timedelta(1, 1)}
+            True
+            >>> json_loads('{"test": "timedelta(seconds=\'86401.0\')", "a": [1, 2]}') == {
+            ...     'test': timedelta(1, 1), 'a': [1, 2]}
+            True
+
+        Pass `date_keys` to only decode the values of some keys:
+
+            >>> json_loads('{"a": "2000-01-01", "b": "2000-01-01"}', date_keys=['a'])
+            {'a': datetime.date(2000, 1, 1), 'b': '2000-01-01'}
 
     """
     return JSONDecoder(datetime_pattern, date_pattern, time_pattern,
@@ -275,191 +628,1300 @@ def json_loads(string, datetime_pattern=None, date_pattern=None,
                        time_format, *args, **kwargs).decode(string)
 
 
-def import_from_path(path):
+COMPRESSED_EXTENSIONS = {
+    '.gz': 'gzip',
+    '.bz2': 'bz2',
+    '.xz': 'lzma',
+}
+
+# what the functions accepting a path or a file object consider a path
+_PATH_TYPES = (str, bytes, os.PathLike)
+
+
+def get_compression(path):
     """
-        Import a class dynamically, given it's dotted path.
+        Returns the name of the module to use to compress or decompress
+        the file, according to its extension, or None. The path can be a
+        string, bytes or a path-like object such as pathlib.Path.
     """
-    module_name, class_name = path.rsplit('.', 1)
-    try:
-        return getattr(__import__(module_name, fromlist=[class_name]), class_name)
-    except AttributeError:
-        raise ImportError('Unable to import %s' % path)
+    ext = os.path.splitext(os.fsdecode(path))[1]
+    return COMPRESSED_EXTENSIONS.get(ext.lower())
+
 
+def open_file(path, mode='r', encoding='utf8', errors='strict',
+              buffering=-1, newline=None, compression=None):
+    """
+        Open a file, transparently compressing or decompressing it if
+        its extension is listed in COMPRESSED_EXTENSIONS.
 
+        You can force the compression module name to use with
+        `compression`, or disable it by passing False. If you pass a
+        compression module, `path` can also be a binary file object,
+        which won't be closed with the returned file.
 
-def attr(obj, *attrs, **kwargs):
+        Text modes use `encoding` and `errors`, binary modes ignore them.
     """
-        Follow chained attributes and get the value of the last attributes.
-        If an attribute error is raised, returns the default value.
+    if compression is None:
+        compression = get_compression(path)
 
-        res = attr(data, 'test', 'o', 'bla', default="yeah")
+    binary = 'b' in mode
+    if binary:
+        encoding = errors = newline = None
 
-        is the equivalent of
+    if not compression:
+        return io.open(path, mode, buffering, encoding=encoding,
+                       errors=errors, newline=newline)
 
-        try:
-            res = getattr(getattr(getattr(data, 'test'), 'o'), 'bla')
-        except AttributeError:
-            res = "yeah"
+    opener = __import__(compression).open
+    if binary:
+        return opener(path, mode)
+    if 't' not in mode:
+        mode += 't'
+    return opener(path, mode, encoding=encoding, errors=errors, newline=newline)
 
-    """
-    try:
-        value = getattr(obj, attrs[0])
 
-        for attr in attrs[1:]:
-            value = getattr(value, attr)
-    except (IndexError, AttributeError):
-        return kwargs.get('default', None)
+JSONL_BUFFER_SIZE = 1024 * 1024
+JSONL_BATCH_SIZE = 1000
 
-    return value
 
+def dump_jsonl(iterable, fileobj, batch_size=JSONL_BATCH_SIZE, *args, **kwargs):
+    r"""
+        Write each object of `iterable` as a line of JSON in `fileobj`,
+        using the same encoding than json_dumps(), and returns the number
+        of lines written.
 
-def chunks(seq, chunksize, process=tuple):
-    """
-        Yields items from an iterator in iterable chunks.
+        `fileobj` can be an opened text file or a path (str, bytes or
+        pathlib.Path). Path ending with ".gz" will be gzip compressed.
+        Lines are written by batches of `batch_size`. Additional
+        parameters are passed to JSONEncoder, except `indent` which would
+        split objects on several lines.
+
+        :Example:
+
+            >>> import io, datetime
+            >>> f = io.StringIO()
+            >>> dump_jsonl([{'a': 1}, {'a': datetime.date(2000, 1, 1)}], f)
+            2
+            >>> print(f.getvalue())
+            {"a": 1}
+            {"a": "2000-01-01"}
+            <BLANKLINE>
     """
-    it = iter(seq)
+    if kwargs.get('indent') is not None:
+        raise ValueError("JSON lines can't be indented")
+
+    if isinstance(fileobj, _PATH_TYPES):
+        with open_file(fileobj, 'w', buffering=JSONL_BUFFER_SIZE) as f:
+            return dump_jsonl(iterable, f, batch_size, *args, **kwargs)
+
+    encode = JSONEncoder(*args, **kwargs).encode
+    writelines = fileobj.writelines
+    count = 0
+    iterator = iter(iterable)
     while True:
-        yield process(chain([next(it)], islice(it, chunksize - 1)))
+        batch = [encode(obj) + '\n' for obj in islice(iterator, batch_size)]
+        if not batch:
+            return count
+        writelines(batch)
+        count += len(batch)
+
+
+def iter_jsonl(fileobj, *args, **kwargs):
+    r"""
+        Returns a generator lazily yielding the objects from a file
+        containing one JSON document per line, decoding them the same
+        way than json_loads(). Blank lines are ignored.
 
+        `fileobj` can be an opened file or a path (str, bytes or
+        pathlib.Path). Path ending with ".gz" will be gzip decompressed.
+        Additional parameters are passed to JSONDecoder.
 
+        :Example:
 
-def window(iterable, size=2, cast=tuple):
+            >>> import io
+            >>> f = io.StringIO('{"a": 1}\n\n{"a": "2000-01-01"}\n')
+            >>> list(iter_jsonl(f))
+            [{'a': 1}, {'a': datetime.date(2000, 1, 1)}]
     """
-        Yields iterms by bunch of a given size, but rolling only one item
-        in and out at a time when iterating.
+    if isinstance(fileobj, _PATH_TYPES):
+        with open_file(fileobj, 'r', buffering=JSONL_BUFFER_SIZE) as f:
+            for obj in iter_jsonl(f, *args, **kwargs):
+                yield obj
+        return
 
-        >>> list(window([1, 2, 3]))
-        [(1, 2), (2, 3)]
+    decode = JSONDecoder(*args, **kwargs).decode
+    for line in fileobj:
+        if isinstance(line, bytes):
+            line = line.decode('utf8')
+        if not line.isspace():
+            yield decode(line)
 
-        By default, this will cast the window to a tuple before yielding it;
-        however, any function that will accept an iterable as its argument
-        is a valid target.
 
-        If you pass None as a cast value, the deque will be returned as-is,
-        which is more performant. However, since only one deque is used
-        for the entire iteration, you'll get the same reference everytime,
-        only the deque will contains different items. The result might not
-        be what you want :
+JSON_ARRAY_CHUNK_SIZE = 64 * 1024
+_json_whitespace = re.compile(r'[ \t\n\r]*')
+_json_number_chars = re.compile(r'[-+.eE0-9]*')
+# a decoding error this close to the end of the buffer may just be a token
+# cut by the chunk, "-Infinity" being the longest one reported at its start
+_json_max_cut_token = len('-Infinity')
 
-        >>> list(window([1, 2, 3], cast=None))
-        [deque([2, 3], maxlen=2), deque([2, 3], maxlen=2)]
 
-    """
-    iterable = iter(iterable)
-    d = deque(islice(iterable, size), size)
-    if cast:
-        yield cast(d)
-        for x in iterable:
-            d.append(x)
-            yield cast(d)
-    else:
-        yield d
-        for x in iterable:
-            d.append(x)
-            yield d
+def iter_json_array(fileobj, chunk_size=JSON_ARRAY_CHUNK_SIZE, *args, **kwargs):
+    r"""
+        Returns a generator lazily yielding the elements of a file containing
+        a JSON array, decoding them the same way than json_loads().
 
+        The file is read by chunks of `chunk_size` characters, so memory
+        usage is proportional to the biggest element, not to the whole file.
 
-def dmerge(d1, d2, merge_func=None):
-    """
-        Create a new dictionary being the merge of the two passed as a
-        parameter. If a key is in both dictionaries, the values are processed
-        with the merge_func.
+        `fileobj` can be an opened file or a path (str, bytes or
+        pathlib.Path). Path ending with ".gz" will be gzip decompressed.
+        Binary files are decoded as utf8. Additional parameters are passed
+        to JSONDecoder.
+
+        Like with json_loads(), anything else than whitespaces after the
+        array raises a ValueError, once all the elements have been yielded.
+
+        :Example:
 
-        By default the value in the second dictionary erases the value in the
-        first one.
+            >>> import io
+            >>> f = io.StringIO('[{"a": "2000-01-01"}, 2, [3, 4]]')
+            >>> list(iter_json_array(f, chunk_size=4))
+            [{'a': datetime.date(2000, 1, 1)}, 2, [3, 4]]
+
+        A syntax error is raised as soon as it is found, without reading
+        the rest of the file:
+
+            >>> f = io.StringIO('[1, [2, x], ' + '3, ' * 100000 + '4]')
+            >>> list(iter_json_array(f, chunk_size=4))
+            Traceback (most recent call last):
+            ...
+            json.decoder.JSONDecodeError: Expecting value: line 1 column 5 (char 4)
+            >>> f.tell() < 100
+            True
     """
-    d = {}
+    if isinstance(fileobj, _PATH_TYPES):
+        with open_file(fileobj, 'r') as f:
+            for obj in iter_json_array(f, chunk_size, *args, **kwargs):
+                yield obj
+        return
+
+    raw_decode = JSONDecoder(*args, **kwargs).raw_decode
+    skip_whitespace = _json_whitespace.match
+    skip_number = _json_number_chars.match
+    read = fileobj.read
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+
+    def read_more(buf, pos):
+        # read at least as much as we have left, so that decoding a big
+        # element doesn't become quadratic
+        data = read(max(chunk_size, len(buf) - pos))
+        eof = not data
+        if isinstance(data, bytes):
+            data = utf8.decode(data, eof)
+        return buf[pos:] + data, 0, eof
+
+    buf, pos, eof = '', 0, False
+    # what we expect next: '[', a value or ']', a value, ',' or ']', or
+    # only whitespaces until the end of the file
+    state = '['
+
+    while True:
+
+        pos = skip_whitespace(buf, pos).end()
+
+        if pos == len(buf):
+            if eof:
+                if state == 'end':
+                    return
+                raise ValueError('Unexpected end of JSON array')
+            buf, pos, eof = read_more(buf, pos)
+            continue
+
+        char = buf[pos]
+
+        if state == '[':
+            if char != '[':
+                raise ValueError('Expecting a JSON array, got %r' % char)
+            state, pos = 'value or ]', pos + 1
+
+        elif state == 'end':
+            raise ValueError('Extra data after the JSON array: %r' % char)
 
-    d.update(d1)
+        elif state == ', or ]':
+            if char == ']':
+                state, pos = 'end', pos + 1
+                continue
+            if char != ',':
+                raise ValueError('Expecting "," or "]", got %r' % char)
+            state, pos = 'value', pos + 1
 
-    if merge_func is None:
-        d.update(d2)
-        return d
+        elif state == 'value or ]' and char == ']':
+            state, pos = 'end', pos + 1
+            continue
 
-    for k, v in d2.iteritems():
-        if k in d:
-            d[k] = merge_func(d[k], v)
         else:
-            d[k] = v
-    return d
+            # a number may continue in the next chunk
+            if (char in '-0123456789' and not eof and
+                    skip_number(buf, pos).end() == len(buf)):
+                buf, pos, eof = read_more(buf, pos)
+                continue
 
+            try:
+                obj, end = raw_decode(buf, pos)
+            except json.JSONDecodeError as e:
+                # only read more if the element is not entirely in the
+                # buffer, a syntax error in it must not load the whole file
+                truncated = (e.msg.startswith('Unterminated string') or
+                             len(buf) - e.pos < _json_max_cut_token)
+                if eof or not truncated:
+                    raise
+                buf, pos, eof = read_more(buf, pos)
+                continue
 
+            yield obj
+            state, pos = ', or ]', end
 
-def get(data, *keys, **kwargs):
+        # drop what we already decoded so the buffer doesn't grow forever
+        if pos > chunk_size:
+            buf, pos = buf[pos:], 0
+
+
+_imported = {}
+_import_durations = {}
+
+
+def import_from_path(path):
     """
-        Extract a data from nested mapping and sequences using a list of keys
-        and indices to apply successively. If a key error or an index error
-        is raised, returns the default value.
+        Import a class dynamically, given it's dotted path.
 
-        res = get(data, 'test', 0, 'bla', default="yeah")
+        You can also separate the module from the attribute with a colon,
+        which allows to get nested attributes:
 
-        is the equivalent of
+        :Example:
 
-        try:
-            res = data['test'][0]['bla']
-        except (KeyError, IndexError):
-            res = "yeah"
+            >>> import_from_path('os.path.join').__name__
+            'join'
+            >>> import_from_path('datetime:datetime.strptime').__name__
+            'strptime'
 
+        Results are cached, so importing the same path again is only a
+        dict lookup. The time spent importing each path is available
+        in import_report().
     """
     try:
-        value = data[keys[0]]
+        return _imported[path]
+    except KeyError:
+        pass
 
-        for key in keys[1:]:
-            value = value[key]
-    except (KeyError, IndexError, TypeError):
-        return kwargs.get('default', None)
+    start = timer()
 
-    return value
+    if ':' in path:
+        module_name, attrs = path.split(':', 1)
+        attrs = attrs.split('.')
+    else:
+        module_name, attr = path.rsplit('.', 1)
+        attrs = [attr]
 
+    try:
+        obj = __import__(module_name, fromlist=[attrs[0]])
+        for attr in attrs:
+            obj = getattr(obj, attr)
+    except AttributeError:
+        raise ImportError('Unable to import %s' % path)
 
+    _import_durations[path] = timer() - start
+    _imported[path] = obj
+    return obj
 
-def subdict(dct, include=(), exclude=()):
+
+def import_report():
     """
-        Return a dictionary that is a copy of the given one.
+        Returns a list of (path, seconds) for each path imported with
+        import_from_path(), the slowest first.
+    """
+    return sorted(_import_durations.items(), key=lambda x: x[1], reverse=True)
 
-        All values in `include` are used as key to be copied to
-         the resulting dictionary.
 
-        You can also pass a list of key to exclude instead by setting
-        `exclude`. But you can't use both `include` and `exclude`: if you do,
-        `exclude will be ignored`
+class LazyImport(object):
+    """
+        Proxy to the object at the given dotted path, only importing it
+        the first time you get an attribute from it or call it.
 
-        Example:
+        See lazy_import_from_path(). Use resolve_lazy_import() to get the
+        actual object.
+    """
 
-        >>> subdict({1:None, 2: False, 3: True}, [1, 2])
-        {1: None, 2: False}
-        >>> subdict({1:None, 2: False, 3: True}, exclude=[1, 2])
-        {3: True}
+    # private names only, not to hide the attributes of the object
+    __slots__ = ('_path', '_obj')
 
-    """
+    def __init__(self, path):
+        self._path = path
+        self._obj = _NOTHING
 
-    if include:
-        return dict((k, v) for k, v in dct.items() if k in include)
+    def _resolve(self):
+        obj = self._obj
+        if obj is _NOTHING:
+            obj = self._obj = import_from_path(self._path)
+        return obj
 
-    return dict((k, v) for k, v in dct.items() if k not in exclude)
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
 
+    def __call__(self, *args, **kwargs):
+        return self._resolve()(*args, **kwargs)
 
-def iget(data, value, default=None):
+    def __repr__(self):
+        if self._obj is _NOTHING:
+            return '<LazyImport %r (not imported yet)>' % self._path
+        return '<LazyImport %r: %r>' % (self._path, self._obj)
+
+
+def lazy_import_from_path(path):
     """
-        Same as indexing, but works with any iterable,
-        including generators, and accept a default value.
+        Same as import_from_path(), but returns a LazyImport proxy and
+        import the object only when it's actually used.
 
         :Example:
 
-        >>> iget(xrange(10), 0)
-        0
-        >>> iget(xrange(10), 5)
-        5
-        >>> iget(xrange(10), 10000, default='wololo')
-        'wololo'
+            >>> join = lazy_import_from_path('os.path.join')
+            >>> join('a', 'b') == os.path.join('a', 'b')
+            True
+    """
+    return LazyImport(path)
+
+
+def resolve_lazy_import(obj):
+    """
+        Import the object behind a LazyImport proxy if it's not done yet,
+        and returns it. Other objects are returned as is.
+
+        :Example:
+
+            >>> Path = lazy_import_from_path('pathlib.Path')
+            >>> resolve_lazy_import(Path).__name__
+            'Path'
+            >>> Path.resolve is resolve_lazy_import(Path).resolve
+            True
+    """
+    if isinstance(obj, LazyImport):
+        return obj._resolve()
+    return obj
+
+
+
+COMPILED_PATHS_CACHE_SIZE = 1024
+_integer = re.compile(r'-?\d+$')
+
+
+class CompiledPath(object):
+    """
+        Callable extracting a value from nested data by following a fixed
+        path, returning a default value if it can't.
+
+        Use compile_path() and compile_attr_path() to create one.
+    """
+
+    __slots__ = ('path', 'getter', 'exceptions')
+
+    def __init__(self, path, getter, exceptions):
+        self.path = path
+        self.getter = getter
+        self.exceptions = exceptions
+
+    def __call__(self, data, default=None):
+        try:
+            return self.getter(data)
+        except self.exceptions:
+            return default
+
+    def many(self, records, default=None):
+        """
+            Returns a generator yielding the value at the path for each
+            item in `records`.
+        """
+        getter = self.getter
+        exceptions = self.exceptions
+        for record in records:
+            try:
+                yield getter(record)
+            except exceptions:
+                yield default
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, self.path)
+
+
+def _split_path(path):
+    if isinstance(path, str):
+        return tuple(int(key) if _integer.match(key) else key
+                     for key in path.split('.'))
+    if isinstance(path, (tuple, list)):
+        return tuple(path)
+    return (path,)
+
+
+def _chain_getters(getters):
+    if len(getters) == 1:
+        return getters[0]
+
+    if len(getters) == 2:
+        first, second = getters
+        return lambda data: second(first(data))
+
+    if len(getters) == 3:
+        first, second, third = getters
+        return lambda data: third(second(first(data)))
+
+    def getter(data):
+        for get in getters:
+            data = get(data)
+        return data
+
+    return getter
+
+
+@lru_cache(maxsize=COMPILED_PATHS_CACHE_SIZE)
+def _compile_path(keys):
+    getter = _chain_getters([itemgetter(key) for key in keys])
+    return CompiledPath(keys, getter, (KeyError, IndexError, TypeError))
+
+
+@lru_cache(maxsize=COMPILED_PATHS_CACHE_SIZE)
+def _compile_attr_path(names):
+    return CompiledPath(names, attrgetter('.'.join(names)), AttributeError)
+
+
+def compile_path(path):
+    """
+        Returns a CompiledPath to extract data from nested mappings and
+        sequences, like get() does, but faster when you use the same
+        path many times.
+
+        The path is either a string with keys separated by dots, or a
+        sequence of keys. In a string, the keys made of digits are turned
+        into integers to be used as indices, so use a sequence if you need
+        a string key such as '0':
+
+        :Example:
+
+            >>> get_name = compile_path('users.0.name')
+            >>> get_name({'users': [{'name': 'bob'}]})
+            'bob'
+            >>> get_name({'users': []}, default='nobody')
+            'nobody'
+            >>> list(compile_path(['a', 'b']).many([{'a': {'b': 1}}, {}]))
+            [1, None]
+            >>> compile_path('a.0')({'a': {'0': 1}}) is None
+            True
+            >>> compile_path(['a', '0'])({'a': {'0': 1}})
+            1
+
+        Compiled paths are cached, so compiling the same path again is cheap.
+    """
+    keys = _split_path(path)
+    if not keys:
+        raise ValueError('The path must contain at least one key')
+    return _compile_keys(keys)
+
+
+def _compile_keys(keys):
+    try:
+        return _compile_path(keys)
+    except TypeError:  # some keys are not hashable so we can't cache it
+        return _compile_path.__wrapped__(keys)
+
+
+def compile_attr_path(path):
+    """
+        Returns a CompiledPath to follow chained attributes, like attr()
+        does, but faster when you use the same path many times.
+
+        The path is either a string with attributes separated by dots,
+        or a sequence of attribute names.
+
+        :Example:
+
+            >>> get_real = compile_attr_path('imag.real')
+            >>> get_real(1j)
+            1.0
+            >>> get_real(None, default=0)
+            0
+    """
+    if isinstance(path, str):
+        names = tuple(path.split('.'))
+    else:
+        names = tuple(path)
+    if not names:
+        raise ValueError('The path must contain at least one attribute')
+    return _compile_attr_path(names)
+
+
+def attr(obj, *attrs, **kwargs):
+    """
+        Follow chained attributes and get the value of the last attributes.
+        If an attribute error is raised, returns the default value.
+
+        res = attr(data, 'test', 'o', 'bla', default="yeah")
+
+        is the equivalent of
+
+        try:
+            res = getattr(getattr(getattr(data, 'test'), 'o'), 'bla')
+        except AttributeError:
+            res = "yeah"
+
+        If you call it in a loop with the same attributes, use
+        compile_attr_path() instead.
+    """
+    try:
+        value = getattr(obj, attrs[0])
+
+        for attr in attrs[1:]:
+            value = getattr(value, attr)
+    except (IndexError, AttributeError):
+        return kwargs.get('default', None)
+
+    return value
+
+
+_SLICEABLE_TYPES = (list, tuple, range, str)
+_BUFFER_TYPES = (bytes, bytearray, array, mmap, memoryview)
+
+FILE_CHUNK_SIZE = 64 * 1024
+
+
+def chunks(seq, chunksize, process=tuple, fillvalue=_NOTHING, drop_last=False):
+    """
+        Yields items from an iterator in iterable chunks.
+
+        :Example:
+
+            >>> list(chunks(range(5), 2))
+            [(0, 1), (2, 3), (4,)]
+            >>> list(chunks(iter(range(5)), 2, fillvalue=None))
+            [(0, 1), (2, 3), (4, None)]
+            >>> list(chunks('abcde', 2, process=''.join, drop_last=True))
+            ['ab', 'cd']
+
+        Each chunk is passed to `process` before being yielded. If you set
+        it to None, you get the chunks as they are extracted, which is
+        faster: slices for lists, tuples, strings and ranges, memoryviews
+        for bytes, bytearray, array and mmap (so there is no copy), and
+        tuples for everything else.
+
+            >>> [bytes(chunk) for chunk in chunks(b'abcde', 2, process=None)]
+            [b'ab', b'cd', b'e']
+
+        If the last chunk is smaller than `chunksize`, you can either
+        skip it with `drop_last` or fill it with `fillvalue`. With
+        `process=None`, a padded chunk keeps the type of the other chunks
+        for lists, tuples, and strings padded with a single character,
+        and is a tuple otherwise.
+
+            >>> list(chunks([1, 2, 3, 4, 5], 2, process=None, fillvalue=0))
+            [[1, 2], [3, 4], [5, 0]]
+    """
+    if chunksize < 1:
+        raise ValueError('chunksize must be at least 1')
+
+    if process is tuple:
+        process = None
+        cast = tuple
+    else:
+        cast = None
+
+    if isinstance(seq, _BUFFER_TYPES):
+        return _sliced_chunks(memoryview(seq), chunksize, process or cast,
+                              fillvalue, drop_last)
+
+    if isinstance(seq, _SLICEABLE_TYPES):
+        return _sliced_chunks(seq, chunksize, process or cast, fillvalue,
+                              drop_last)
+
+    return _iter_chunks(seq, chunksize, process, fillvalue, drop_last)
+
+
+def _sliced_chunks(seq, chunksize, process, fillvalue, drop_last):
+    length = len(seq)
+    stop = length - length % chunksize
+
+    if process is None:
+        for i in range(0, stop, chunksize):
+            yield seq[i:i + chunksize]
+    else:
+        for i in range(0, stop, chunksize):
+            yield process(seq[i:i + chunksize])
+
+    if stop == length or drop_last:
+        return
+
+    chunk = seq[stop:]
+    if fillvalue is not _NOTHING:
+        missing = chunksize - len(chunk)
+        if isinstance(chunk, list):
+            chunk = chunk + [fillvalue] * missing
+        elif isinstance(chunk, tuple):
+            chunk = chunk + (fillvalue,) * missing
+        elif (isinstance(chunk, str) and isinstance(fillvalue, str) and
+                len(fillvalue) == 1):
+            chunk = chunk + fillvalue * missing
+        else:  # ranges and memoryviews can't be padded
+            chunk = tuple(chain(chunk, (fillvalue,) * missing))
+    yield chunk if process is None else process(chunk)
+
+
+def _iter_chunks(iterable, chunksize, process, fillvalue, drop_last):
+    iterator = iter(iterable)
+    while True:
+        chunk = tuple(islice(iterator, chunksize))
+
+        if len(chunk) < chunksize:
+            if not chunk or drop_last:
+                return
+            if fillvalue is not _NOTHING:
+                chunk += (fillvalue,) * (chunksize - len(chunk))
+            yield chunk if process is None else process(chunk)
+            return
+
+        yield chunk if process is None else process(chunk)
+
+
+def file_chunks(fileobj, chunksize=FILE_CHUNK_SIZE, process=None,
+                fillvalue=_NOTHING, drop_last=False):
+    """
+        Yields the content of a binary file in chunks of `chunksize` bytes.
+
+        `fileobj` can be an opened file or a path (str, bytes or
+        pathlib.Path). Path ending with ".gz" will be gzip decompressed.
+
+        :Example:
+
+            >>> import io
+            >>> list(file_chunks(io.BytesIO(b'abcde'), 2, process=bytes))
+            [b'ab', b'cd', b'e']
+
+        The data is read in a buffer allocated once for the whole file, and
+        by default, memoryviews on this buffer are yielded. It's fast, but
+        the content of the previous chunk is overwritten by the next one,
+        so pass `process=bytes` if you need to keep them around.
+
+        If the last chunk is smaller than `chunksize`, you can either
+        skip it with `drop_last` or fill it with `fillvalue`, which must
+        be an integer between 0 and 255.
+    """
+    if isinstance(fileobj, _PATH_TYPES):
+        with open_file(fileobj, 'rb') as f:
+            for chunk in file_chunks(f, chunksize, process, fillvalue, drop_last):
+                yield chunk
+        return
+
+    if chunksize < 1:
+        raise ValueError('chunksize must be at least 1')
+
+    view = memoryview(bytearray(chunksize))
+    readinto = fileobj.readinto
+
+    while True:
+
+        size = readinto(view) or 0
+        # raw files and pipes may return less than asked before the end
+        while 0 < size < chunksize:
+            read = readinto(view[size:])
+            if not read:
+                break
+            size += read
+
+        if size < chunksize:
+            if not size or drop_last:
+                return
+            if fillvalue is not _NOTHING:
+                view[size:] = bytes(bytearray((fillvalue,))) * (chunksize - size)
+            else:
+                chunk = view[:size]
+                yield chunk if process is None else process(chunk)
+                return
+
+        yield view if process is None else process(view)
+
+
+def window(iterable, size=2, cast=tuple, step=1):
+    """
+        Yields iterms by bunch of a given size, but rolling only one item
+        in and out at a time when iterating.
+
+        >>> list(window([1, 2, 3]))
+        [(1, 2), (2, 3)]
+
+        You can roll several items at a time by setting `step`:
+
+        >>> list(window(range(7), 3, step=2))
+        [(0, 1, 2), (2, 3, 4), (4, 5, 6)]
+
+        By default, this will cast the window to a tuple before yielding it;
+        however, any function that will accept an iterable as its argument
+        is a valid target.
+
+        If you pass None as a cast value, the deque will be returned as-is,
+        which is more performant. However, since only one deque is used
+        for the entire iteration, you'll get the same reference everytime,
+        only the deque will contains different items. The result might not
+        be what you want :
+
+        >>> list(window([1, 2, 3], cast=None))
+        [deque([2, 3], maxlen=2), deque([2, 3], maxlen=2)]
+
+        Bytes, bytearray, array, mmap and NumPy arrays are not copied in a
+        deque: you get zero copy views instead, and with cast=None, a new
+        view for each window:
+
+        >>> [w.tolist() for w in window(array('i', [1, 2, 3]), cast=None)]
+        [[1, 2], [2, 3]]
+    """
+    if step < 1:
+        raise ValueError('step must be at least 1')
+
+    numpy = sys.modules.get('numpy')
+    if numpy is not None and isinstance(iterable, numpy.ndarray):
+        sliding_window_view = getattr(numpy.lib.stride_tricks,
+                                      'sliding_window_view', None)
+        if (sliding_window_view is not None and iterable.ndim == 1 and
+                len(iterable) >= size):
+            windows = iter(sliding_window_view(iterable, size)[::step])
+            return windows if cast is None else map(cast, windows)
+        return _sliced_windows(iterable, size, cast, step)
+
+    if isinstance(iterable, _BUFFER_TYPES):
+        return _sliced_windows(memoryview(iterable), size, cast, step)
+
+    # slices give the same result than the deque, and are faster
+    if cast is not None and isinstance(iterable, _SLICEABLE_TYPES):
+        return _sliced_windows(iterable, size, cast, step)
+
+    return _deque_windows(iterable, size, cast, step)
+
+
+def _sliced_windows(seq, size, cast, step):
+    length = len(seq)
+
+    # like with the deque, a too short sequence gives one incomplete window
+    if length < size:
+        yield seq[:] if cast is None else cast(seq)
+        return
+
+    if cast is None:
+        for i in range(0, length - size + 1, step):
+            yield seq[i:i + size]
+    else:
+        for i in range(0, length - size + 1, step):
+            yield cast(seq[i:i + size])
+
+
+def _deque_windows(iterable, size, cast, step):
+    iterable = iter(iterable)
+    d = deque(islice(iterable, size), size)
+
+    if step > 1:
+        yield cast(d) if cast else d
+        while True:
+            items = tuple(islice(iterable, step))
+            if len(items) < step:
+                return
+            d.extend(items)
+            yield cast(d) if cast else d
+
+    elif cast:
+        yield cast(d)
+        for x in iterable:
+            d.append(x)
+            yield cast(d)
+    else:
+        yield d
+        for x in iterable:
+            d.append(x)
+            yield d
+
+
+def rolling_sum(iterable, size):
+    """
+        Yields the sum of each window() of the given size, updating a
+        running total instead of summing each window from scratch.
+
+        :Example:
+
+            >>> list(rolling_sum([1, 2, 3, 4, 5], 3))
+            [6, 9, 12]
+
+        With floats, the running total can accumulate rounding errors.
+    """
+    windows = _deque_windows(iterable, size, None, 1)
+    d = next(windows)
+    if not d:
+        return
+
+    total = sum(d)
+    yield total
+
+    leaving = d[0]
+    for d in windows:
+        total += d[-1] - leaving
+        leaving = d[0]
+        yield total
+
+
+def rolling_mean(iterable, size):
+    """
+        Yields the mean of each window() of the given size, in constant
+        time for each item.
+
+        :Example:
+
+            >>> list(rolling_mean([1, 2, 3, 4, 5], 2))
+            [1.5, 2.5, 3.5, 4.5]
+    """
+    windows = _deque_windows(iterable, size, None, 1)
+    d = next(windows)
+    if not d:
+        return
+
+    total = sum(d)
+    yield total / len(d)
+
+    leaving = d[0]
+    for d in windows:
+        total += d[-1] - leaving
+        leaving = d[0]
+        yield total / size
+
+
+def rolling_var(iterable, size, ddof=0):
+    """
+        Yields the variance of each window() of the given size, updated
+        in constant time for each item using Welford's algorithm.
+
+        By default this is the population variance. Pass `ddof=1` to get
+        the sample variance, in which case `size` must be greater than
+        `ddof`. If the iterable is too short to fill a window and has no
+        more than `ddof` items, nan is yielded.
+
+        :Example:
+
+            >>> [round(v, 4) for v in rolling_var([1, 2, 3, 5, 8], 3)]
+            [0.6667, 1.5556, 4.2222]
+            >>> list(rolling_var([1], 2, ddof=1))
+            [nan]
+    """
+    if size <= ddof:
+        raise ValueError('size must be greater than ddof')
+    return _rolling_var(iterable, size, ddof)
+
+
+def _rolling_var(iterable, size, ddof):
+    windows = _deque_windows(iterable, size, None, 1)
+    d = next(windows)
+    if not d:
+        return
+
+    mean = m2 = 0.0
+    for count, x in enumerate(d, 1):
+        delta = x - mean
+        mean += delta / count
+        m2 += delta * (x - mean)
+    if len(d) <= ddof:
+        yield float('nan')
+        return
+    yield max(m2, 0.0) / (len(d) - ddof)
+
+    divisor = size - ddof
+    leaving = d[0]
+    for d in windows:
+        entering = d[-1]
+        previous_mean = mean
+        mean += (entering - leaving) / size
+        m2 += (entering - leaving) * (entering - mean + leaving - previous_mean)
+        leaving = d[0]
+        yield max(m2, 0.0) / divisor
+
+
+def _rolling_extremum(iterable, size, should_drop):
+    # monotonic deque of (index, value): each item is added and removed
+    # only once, and the extremum is always the first one
+    candidates = deque()
+    append = candidates.append
+    pop = candidates.pop
+    popleft = candidates.popleft
+
+    i = -1
+    for i, x in enumerate(iterable):
+        while candidates and should_drop(candidates[-1][1], x):
+            pop()
+        append((i, x))
+        if candidates[0][0] <= i - size:
+            popleft()
+        if i >= size - 1:
+            yield candidates[0][1]
+
+    # like window(), a too short iterable gives one incomplete window
+    if 0 <= i < size - 1:
+        yield candidates[0][1]
+
+
+def rolling_min(iterable, size):
+    """
+        Yields the minimum of each window() of the given size, in
+        amortized constant time for each item.
+
+        :Example:
+
+            >>> list(rolling_min([3, 1, 4, 1, 5, 9, 2], 3))
+            [1, 1, 1, 1, 2]
+    """
+    return _rolling_extremum(iterable, size, ge)
+
+
+def rolling_max(iterable, size):
+    """
+        Yields the maximum of each window() of the given size, in
+        amortized constant time for each item.
+
+        :Example:
+
+            >>> list(rolling_max([3, 1, 4, 1, 5, 9, 2], 3))
+            [4, 4, 5, 9, 9]
+    """
+    return _rolling_extremum(iterable, size, le)
+
+
+ROLLING_AGGREGATES = {
+    'sum': rolling_sum,
+    'mean': rolling_mean,
+    'var': rolling_var,
+    'min': rolling_min,
+    'max': rolling_max,
+}
+
+
+def rolling(iterable, size, agg):
+    """
+        Yields the result of `agg` for each window() of the given size.
+
+        `agg` can be the name of an aggregate in ROLLING_AGGREGATES, which
+        are computed incrementally:
+
+            >>> list(rolling([1, 2, 3, 4], 2, 'sum'))
+            [3, 5, 7]
+
+        Or any function accepting an iterable, which is called on each
+        window, so it's slower:
+
+            >>> list(rolling([1, 2, 3, 4], 2, lambda w: w[0] * w[1]))
+            [2, 6, 12]
+    """
+    if not callable(agg):
+        return ROLLING_AGGREGATES[agg](iterable, size)
+    return _rolling_callable(iterable, size, agg)
+
+
+def _rolling_callable(iterable, size, agg):
+    windows = _deque_windows(iterable, size, None, 1)
+    d = next(windows)
+    if not d:
+        return
+    yield agg(d)
+    for d in windows:
+        yield agg(d)
+
+
+def _append(old, new):
+    return list(old) + list(new)
+
+
+def _union(old, new):
+    return set(old) | set(new)
+
+
+def _keep_first(old, new):
+    return old
+
+
+def _keep_last(old, new):
+    return new
+
+
+MERGE_STRATEGIES = {
+    'append': _append,
+    'union': _union,
+    'keep_first': _keep_first,
+    'keep_last': _keep_last,
+}
+
+
+def dmerge(*dicts, **kwargs):
+    """
+        Create a new dictionary being the merge of all the ones passed as
+        parameters. If a key is in several dictionaries, the values are
+        processed with the merge_func.
+
+        By default the value in the last dictionary erases the value in the
+        first ones, but nested dictionaries are merged recursively:
+
+        >>> dmerge({'a': 1, 'b': {'c': 1}}, {'b': {'d': 2}}, {'a': 3})
+        {'a': 3, 'b': {'c': 1, 'd': 2}}
+
+        Pass `deep=False` to only merge the first level, and `inplace=True`
+        to update the first dictionary instead of creating a new one, which
+        avoids copies when you merge a lot of them. Only the first dictionary
+        and what it contains are modified, other dictionaries are copied
+        when needed.
+
+        `merge_func` can be a function accepting the old and the new value
+        and returning the merged value, or the name of an entry in
+        MERGE_STRATEGIES: 'append' to concatenate lists, 'union' for sets,
+        'keep_first' or 'keep_last'. It's called for every key found in
+        several dicts, even if both values are dicts, so it takes precedence
+        over the recursive merge, like with the dmerge(d1, d2, merge_func)
+        form of older versions:
+
+        >>> dmerge({'a': {'x': 1}}, {'a': {'y': 2}}, merge_func='keep_first')
+        {'a': {'x': 1}}
+
+        You can also choose a merge function for some keys only with
+        `strategies`, a mapping of paths to strategies. Paths are tuples
+        of keys, or strings with keys separated by dots:
+
+        >>> dmerge({'a': {'b': [1]}, 'c': 1}, {'a': {'b': [2]}, 'c': 2},
+        ...        strategies={'a.b': 'append', 'c': 'keep_first'})
+        {'a': {'b': [1, 2]}, 'c': 1}
+    """
+    deep = kwargs.get('deep', True)
+    inplace = kwargs.get('inplace', False)
+    merge_func = kwargs.get('merge_func')
+    strategies = kwargs.get('strategies')
+
+    # backward compatibility with dmerge(d1, d2, merge_func)
+    if len(dicts) == 3 and callable(dicts[2]) and not isinstance(dicts[2], Mapping):
+        dicts, merge_func = dicts[:2], dicts[2]
+
+    if not dicts:
+        return {}
+
+    if merge_func is not None and not callable(merge_func):
+        merge_func = MERGE_STRATEGIES[merge_func]
+
+    if strategies:
+        strategies = dict(
+            (tuple(path.split('.')) if isinstance(path, str) else tuple(path),
+             strategy if callable(strategy) else MERGE_STRATEGIES[strategy])
+            for path, strategy in strategies.items()
+        )
+
+    result = dicts[0] if inplace else dict(dicts[0])
+
+    if not deep and not merge_func and not strategies:
+        for d in dicts[1:]:
+            result.update(d)
+        return result
+
+    # ids of the dicts we created, and of the mappings we took from the
+    # other dicts, so we know what we can modify without a copy
+    created, borrowed = set([id(result)]), set()
+
+    for d in dicts[1:]:
+        _merge_into(result, d, (), inplace, deep, merge_func, strategies,
+                    created, borrowed)
+
+    return result
+
+
+def _merge_into(target, source, path, original, deep, merge_func, strategies,
+                created, borrowed):
+
+    for key, value in source.items():
+
+        if key not in target:
+            target[key] = value
+            if isinstance(value, Mapping):
+                borrowed.add(id(value))
+            continue
+
+        old = target[key]
+
+        if strategies:
+            strategy = strategies.get(path + (key,))
+            if strategy is not None:
+                target[key] = strategy(old, value)
+                continue
+
+        if merge_func is not None:
+            target[key] = merge_func(old, value)
+
+        elif deep and isinstance(old, Mapping) and isinstance(value, Mapping):
+
+            # 'old' belongs to the first dict, modifying it is fine
+            old_original = (original and id(old) not in borrowed and
+                            isinstance(old, MutableMapping))
+
+            if not old_original and id(old) not in created:
+                old = target[key] = dict(old)
+                created.add(id(old))
+
+            _merge_into(old, value, path + (key,), old_original, deep,
+                        merge_func, strategies, created, borrowed)
+
+        else:
+            target[key] = value
+
+
+
+def get(data, *keys, **kwargs):
+    """
+        Extract a data from nested mapping and sequences using a list of keys
+        and indices to apply successively. If a key error or an index error
+        is raised, returns the default value.
+
+        res = get(data, 'test', 0, 'bla', default="yeah")
+
+        is the equivalent of
+
+        try:
+            res = data['test'][0]['bla']
+        except (KeyError, IndexError):
+            res = "yeah"
+
+        If you call it in a loop with the same keys, use compile_path()
+        instead.
+    """
+    try:
+        value = data[keys[0]]
+
+        for key in keys[1:]:
+            value = value[key]
+    except (KeyError, IndexError, TypeError):
+        return kwargs.get('default', None)
+
+    return value
+
+
+
+def subdict(dct, include=(), exclude=()):
+    """
+        Return a dictionary that is a copy of the given one.
+
+        All values in `include` are used as key to be copied to
+         the resulting dictionary.
+
+        You can also pass a list of key to exclude instead by setting
+        `exclude`. But you can't use both `include` and `exclude`: if you do,
+        `exclude will be ignored`
+
+        Example:
+
+        >>> subdict({1:None, 2: False, 3: True}, [1, 2])
+        {1: None, 2: False}
+        >>> subdict({1:None, 2: False, 3: True}, exclude=[1, 2])
+        {3: True}
+
+        With `include`, only the included keys are looked up so it's fast
+        even on a big dictionary. If you don't need a copy, see
+        subdict_view().
+    """
+
+    if include:
+        return dict((k, dct[k]) for k in include if k in dct)
+
+    if not exclude:
+        return dict(dct)
+
+    exclude = set(exclude)
+    return dict((k, v) for k, v in dct.items() if k not in exclude)
+
+
+class SubdictView(Mapping):
+    """
+        Read only mapping showing only some keys of a dictionary, without
+        copying it. Changes to the dictionary are visible in the view.
+
+        See subdict_view().
+    """
+
+    __slots__ = ('dct', 'include', 'exclude')
+
+    def __init__(self, dct, include=(), exclude=()):
+        self.dct = dct
+        if include:
+            # keeps the order and gives fast lookups
+            self.include = dict.fromkeys(include)
+            self.exclude = None
+        else:
+            self.include = None
+            self.exclude = frozenset(exclude)
+
+    def __getitem__(self, key):
+        if self.include is None:
+            if key in self.exclude:
+                raise KeyError(key)
+        elif key not in self.include:
+            raise KeyError(key)
+        return self.dct[key]
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        dct = self.dct
+        if self.include is None:
+            exclude = self.exclude
+            return (k for k in dct if k not in exclude)
+        return (k for k in self.include if k in dct)
+
+    def __len__(self):
+        return sum(1 for k in self)
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, dict(self))
+
+
+def subdict_view(dct, include=(), exclude=()):
+    """
+        Same as subdict(), but returns a read only SubdictView on the
+        dictionary instead of a copy. Call dict() on it when you need
+        a real dictionary.
+
+        Example:
+
+        >>> view = subdict_view({1:None, 2: False, 3: True}, [1, 2])
+        >>> view[1], 3 in view, len(view)
+        (None, False, 2)
+        >>> dict(view)
+        {1: None, 2: False}
+    """
+    return SubdictView(dct, include, exclude)
+
+
+def iget(data, value, default=None):
+    """
+        Same as indexing, but works with any iterable,
+        including generators, and accept a default value.
+
+        :Example:
+
+        >>> iget(range(10), 0)
+        0
+        >>> iget(range(10), 5)
+        5
+        >>> iget(range(10), 10000, default='wololo')
+        'wololo'
 
         It works with negative indices as well :
 
-        >>> iget(xrange(10), -3)
+        >>> iget(range(10), -3)
         7
-        >>> iget(xrange(10), -1)
+        >>> iget(range(10), -1)
         9
-        >>> iget(xrange(10), -10000, default='wololo')
+        >>> iget(range(10), -10000, default='wololo')
         'wololo'
 
         Remember it has to consume the generator to get its elements so be careful
@@ -468,7 +1930,15 @@ def iget(data, value, default=None):
         Also if you pass an infinite generator and ask for a negative value,
         it will hang forever. Use itertools.islice to be sure your generator
         will be finite when in doubt.
+
+        Sequences such as lists, tuples or ranges are just indexed.
     """
+    if data.__class__ in _SLICEABLE_TYPES or isinstance(data, Sequence):
+        try:
+            return data[value]
+        except IndexError:
+            return default
+
     if value >= 0:
         for x in islice(data, value, None):
             return x
@@ -483,6 +1953,51 @@ def iget(data, value, default=None):
         return default
 
 
+def iget_many(iterable, indices, default=None):
+    """
+        Same as iget(), but returns a tuple with the values at several
+        indices, or the default value for the ones that don't exist.
+
+        :Example:
+
+        >>> iget_many((x * 10 for x in range(10)), [0, 5, -1, 100])
+        (0, 50, 90, None)
+
+        The iterable is consumed only once, and only what's needed is kept
+        in memory. Like with iget(), negative indices need to consume the
+        whole iterable.
+    """
+    indices = tuple(indices)
+
+    if iterable.__class__ in _SLICEABLE_TYPES or isinstance(iterable, Sequence):
+        size = len(iterable)
+        return tuple(iterable[i] if -size <= i < size else default
+                     for i in indices)
+
+    wanted = set(i for i in indices if i >= 0)
+    tail_size = max([-i for i in indices if i < 0] or [0])
+    found = {}
+
+    if tail_size:
+        tail = deque((), tail_size)
+        append = tail.append
+        for i, x in enumerate(iterable):
+            append(x)
+            if i in wanted:
+                found[i] = x
+        tail_length = len(tail)
+        for i in indices:
+            if i < 0 and -i <= tail_length:
+                found[i] = tail[i]
+
+    elif wanted:
+        for i, x in enumerate(islice(iterable, max(wanted) + 1)):
+            if i in wanted:
+                found[i] = x
+
+    return tuple(found.get(i, default) for i in indices)
+
+
 def unpack(indexable, *args, **kwargs):
     """
         Return an generator with the values for the given keys/indices or
@@ -500,15 +2015,60 @@ def unpack(indexable, *args, **kwargs):
         1
         >>> list(unpack(range(5, 10), 2, 4))
         [7, 9]
+
+        Pass `as_tuple=True` to get a tuple instead of a generator, and
+        `paths=True` to use dotted strings or sequences of keys as paths
+        in nested data, like with compile_path():
+
+        >>> unpack({'file.txt': 1}, 'file.txt', as_tuple=True)
+        (1,)
+        >>> unpack({'a': {'b': [1, 2]}}, 'a.b.1', ('a', 'c'), paths=True,
+        ...        as_tuple=True)
+        (2, None)
+
+        It also works on iterables that can only be read once, such as
+        generators, in which case they are consumed in a single pass, and
+        the keys (or the first key of the paths) must be integers:
+
+        >>> unpack((x * 2 for x in range(5)), 1, -1, as_tuple=True)
+        (2, 8)
     """
 
     default = kwargs.get('default', None)
 
-    for key in args:
-        yield get(indexable, key, default=default)
-
+    if kwargs.get('paths', False):
+        getters = [compile_path(key) for key in args]
+    else:
+        getters = [_compile_keys((key,)) for key in args]
 
-def skip_duplicates(iterable, key=lambda x: x):
+    if hasattr(indexable, '__getitem__'):
+        values = tuple(getter(indexable, default) for getter in getters)
+    else:
+        for getter in getters:
+            if not isinstance(getter.path[0], int):
+                raise TypeError('Iterables without __getitem__ can only be '
+                                'unpacked with integer indices, not %r'
+                                % (getter.path[0],))
+        firsts = iget_many(indexable,
+                           [getter.path[0] for getter in getters], _NOTHING)
+        values = tuple(
+            default if first is _NOTHING
+            else _compile_keys(getter.path[1:])(first, default)
+            if len(getter.path) > 1
+            else first
+            for first, getter in zip(firsts, getters)
+        )
+
+    if kwargs.get('as_tuple', False):
+        return values
+    return iter(values)
+
+
+BLOOM_CAPACITY = 1000000
+
+
+def skip_duplicates(iterable, key=None, max_size=None, window=None,
+                    bloom=False, capacity=BLOOM_CAPACITY, error_rate=0.01):
     """
         Returns a generator that will yield all objects from iterable, skipping
         duplicates.
@@ -561,23 +2121,70 @@ def skip_duplicates(iterable, key=lambda x: x):
                                  non hashable elements and honors __eq__.
           - remove_duplicates : remove duplicates from a list in place.
                                 Most ressource efficient merthod.
+
+        On infinite streams, the fingerprints would eventually fill up the
+        memory, so you can bound it in several ways :
+
+        - max_size : only remember this number of fingerprints, forgetting
+                     the ones that have not been seen for the longest time.
+        - window : only skip an object if it's a duplicate of one of the
+                   previous `window` objects.
+        - bloom : use a bloom filter sized for `capacity` distinct objects
+                  with a rate of false positives of `error_rate`. It means
+                  some objects that are not duplicates will be skipped.
+                  It uses much less memory than the other modes, but
+                  setting the bits in pure Python makes it about 20 times
+                  slower than the default mode (with error_rate=0.01),
+                  so prefer max_size if speed matters more than memory.
+
+        :Example:
+
+            >>> list(skip_duplicates([1, 2, 1, 3, 3, 1], window=2))
+            [1, 2, 3, 1]
+            >>> list(skip_duplicates([1, 2, 1, 3, 1, 2], max_size=2))
+            [1, 2, 3, 2]
+            >>> list(skip_duplicates([1, 2, 3, 4, 4, 2, 1, 3 , 4], bloom=True))
+            [1, 2, 3, 4]
     """
-    fingerprints = set()
+
+    if sum(map(bool, (max_size, window, bloom))) > 1:
+        raise ValueError("Choose only one of 'max_size', 'window' or 'bloom'")
+
+    if max_size:
+        seen = _lru_seen(max_size)
+    elif window:
+        seen = _window_seen(window)
+    elif bloom:
+        seen = BloomFilter(capacity, error_rate).add
+    else:
+        seen = None
 
     try:
-        # duplicate some code to gain perf in the most common case
-        if key is None:
+        if seen is not None:
             for x in iterable:
-                if x not in fingerprints:
+                fingerprint = x if key is None else key(x)
+                if not seen(fingerprint):
                     yield x
-                    fingerprints.add(x)
+
         else:
-            for x in iterable:
-                fingerprint = key(x)
-                if fingerprint not in fingerprints:
-                    yield x
-                    fingerprints.add(fingerprint)
+            fingerprints = set()
+
+            # duplicate some code to gain perf in the most common case
+            if key is None:
+                for x in iterable:
+                    if x not in fingerprints:
+                        yield x
+                        fingerprints.add(x)
+            else:
+                for x in iterable:
+                    fingerprint = key(x)
+                    if fingerprint not in fingerprints:
+                        yield x
+                        fingerprints.add(fingerprint)
+
     except TypeError:
+        if key is None:
+            fingerprint = x
         try:
             hash(fingerprint)
         except TypeError:
@@ -590,64 +2197,683 @@ def skip_duplicates(iterable, key=lambda x: x):
                 type(fingerprint), x)
             )
         else:
-            raise
+            raise
+
+
+def _lru_seen(max_size):
+    """
+        Returns a function telling if a fingerprint has been seen among
+        the `max_size` most recently seen ones, and recording it.
+    """
+    fingerprints = OrderedDict()
+    move_to_end = fingerprints.move_to_end
+    popitem = fingerprints.popitem
+
+    def seen(fingerprint):
+        if fingerprint in fingerprints:
+            move_to_end(fingerprint)
+            return True
+        fingerprints[fingerprint] = None
+        if len(fingerprints) > max_size:
+            popitem(last=False)
+        return False
+
+    return seen
+
+
+def _window_seen(window):
+    """
+        Returns a function telling if a fingerprint is among the `window`
+        previous ones, and recording it.
+    """
+    recent = deque()
+    counts = {}
+
+    def seen(fingerprint):
+        count = counts.get(fingerprint, 0)
+        counts[fingerprint] = count + 1
+        recent.append(fingerprint)
+
+        if len(recent) > window:
+            oldest = recent.popleft()
+            remaining = counts[oldest] - 1
+            if remaining:
+                counts[oldest] = remaining
+            else:
+                del counts[oldest]
+
+        return count > 0
+
+    return seen
+
+
+_UINT64_MASK = 0xFFFFFFFFFFFFFFFF
+
+
+def _splitmix64(value):
+    value = (value + 0x9e3779b97f4a7c15) & _UINT64_MASK
+    value = ((value ^ (value >> 30)) * 0xbf58476d1ce4e5b9) & _UINT64_MASK
+    value = ((value ^ (value >> 27)) * 0x94d049bb133111eb) & _UINT64_MASK
+    return value ^ (value >> 31)
+
+
+class BloomFilter(object):
+    """
+        Probabilistic set using a fixed amount of memory, calculated from
+        the number of items you intend to add and the rate of false
+        positives you accept.
+
+        :Example:
+
+            >>> seen = BloomFilter(capacity=1000, error_rate=0.001)
+            >>> seen.add('foo')
+            False
+            >>> 'foo' in seen, 'bar' in seen
+            (True, False)
+
+        The rate of false positives stays close to `error_rate` when the
+        filter is full, even for consecutive integers:
+
+            >>> seen = BloomFilter(capacity=10000, error_rate=0.01)
+            >>> for i in range(10000):
+            ...     _ = seen.add(i)
+            >>> false_positives = sum(i in seen for i in range(10000, 60000))
+            >>> 0.005 < false_positives / 50000 < 0.015
+            True
+
+        Items can't be removed, and it's always possible for an item that
+        was never added to be reported as present, but never the other way
+        around.
+
+        Each operation checks `hashes` bits (7 for an error rate of 0.01)
+        in a Python loop, so expect about a microsecond per item.
+    """
+
+    __slots__ = ('size', 'hashes', 'bits', '_rounds')
+
+    def __init__(self, capacity=BLOOM_CAPACITY, error_rate=0.01):
+        if not 0 < error_rate < 1:
+            raise ValueError('error_rate must be between 0 and 1')
+        capacity = max(capacity, 1)
+        self.size = int(math.ceil(-capacity * math.log(error_rate) /
+                                  math.log(2) ** 2))
+        self.hashes = max(1, int(round(self.size / capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+        self._rounds = range(self.hashes)
+
+    # double hashing: the k positions are derived from the start and the
+    # step taken from the hash, mixed so that consecutive integers, which
+    # are their own hash, don't produce correlated positions
+
+    def add(self, item):
+        """
+            Add the item, and returns True if it was (probably) already here.
+        """
+        bits = self.bits
+        size = self.size
+        mixed = _splitmix64(hash(item) & _UINT64_MASK)
+        position = mixed % size
+        step = ((mixed >> 32) | 1) % size or 1
+        present = True
+        for _ in self._rounds:
+            byte = position >> 3
+            mask = 1 << (position & 7)
+            if not bits[byte] & mask:
+                present = False
+                bits[byte] |= mask
+            position += step
+            if position >= size:
+                position -= size
+        return present
+
+    def __contains__(self, item):
+        bits = self.bits
+        size = self.size
+        mixed = _splitmix64(hash(item) & _UINT64_MASK)
+        position = mixed % size
+        step = ((mixed >> 32) | 1) % size or 1
+        for _ in self._rounds:
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+            position += step
+            if position >= size:
+                position -= size
+        return True
+
+
+# total size of the buffers of the files open at the same time, split
+# between the partitions but never less than MIN_SPILL_BUFFER_SIZE each
+SPILL_BUFFER_SIZE = 1024 * 1024
+MIN_SPILL_BUFFER_SIZE = 64 * 1024
+
+
+def external_skip_duplicates(iterable, key=None, tmpdir=None, partitions=64,
+                             preserve_order=True, processes=None):
+    """
+        Same as skip_duplicates(), but using temporary files instead of
+        memory, to remove duplicates from datasets that don't fit in RAM.
+
+        Each object is pickled with its fingerprint to one of `partitions`
+        files chosen from the fingerprint hash, so all duplicates end up in
+        the same file. Then each file is deduplicated separately, so you
+        only need enough memory for the fingerprints of one partition.
+        Objects and fingerprints must therefore be picklable.
+
+        :Example:
+
+            >>> list(external_skip_duplicates([1, 2, 3, 4, 4, 2, 1, 3 , 4]))
+            [1, 2, 3, 4]
+
+        Files are created in a temporary directory inside `tmpdir`, which
+        defaults to the system temporary directory, and are removed at the
+        end.
+
+        By default, objects are yielded in the order they came in, but
+        you can set `preserve_order` to False to get them partition by
+        partition, which is a bit faster.
+
+        Partitions can be processed in parallel by passing the number of
+        worker `processes` to use.
+
+        One file per partition is open at the same time while writing the
+        objects, and again while merging them back when `preserve_order`
+        is True, so keep `partitions` under the open files limit of your
+        system (see `ulimit -n`). Their buffers share SPILL_BUFFER_SIZE.
+    """
+    workdir = tempfile.mkdtemp(prefix='minibelt-', dir=tmpdir)
+    readers = []
+    buffer_size = max(SPILL_BUFFER_SIZE // partitions, MIN_SPILL_BUFFER_SIZE)
+
+    try:
+        inputs = [os.path.join(workdir, '%s.in' % i) for i in range(partitions)]
+        outputs = [os.path.join(workdir, '%s.out' % i) for i in range(partitions)]
+
+        files = [io.open(path, 'wb', buffer_size) for path in inputs]
+        try:
+            dump = pickle.dump
+            protocol = pickle.HIGHEST_PROTOCOL
+            for i, x in enumerate(iterable):
+                fingerprint = x if key is None else key(x)
+                dump((i, fingerprint, x), files[hash(fingerprint) % partitions],
+                     protocol)
+        finally:
+            for f in files:
+                f.close()
+
+        if processes and processes > 1:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(processes) as pool:
+                list(pool.map(_dedup_partition, inputs, outputs))
+        else:
+            for source, destination in zip(inputs, outputs):
+                _dedup_partition(source, destination)
+
+        readers = [_read_spill_file(path, buffer_size) for path in outputs]
+        if preserve_order:
+            # the sequence numbers are unique, so objects are never compared
+            records = heapq.merge(*readers)
+        else:
+            records = chain.from_iterable(readers)
+
+        for i, x in records:
+            yield x
+
+    finally:
+        for reader in readers:
+            reader.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _read_spill_file(path, buffer_size=SPILL_BUFFER_SIZE):
+    with io.open(path, 'rb', buffer_size) as f:
+        load = pickle.Unpickler(f).load
+        while True:
+            try:
+                yield load()
+            except EOFError:
+                return
+
+
+def _dedup_partition(source, destination):
+    """
+        Write in `destination` the (sequence number, object) for each
+        (sequence number, fingerprint, object) in `source` with a
+        fingerprint that has not been seen before, then remove `source`.
+    """
+    fingerprints = set()
+    dump = pickle.dump
+    protocol = pickle.HIGHEST_PROTOCOL
+    with io.open(destination, 'wb', SPILL_BUFFER_SIZE) as f:
+        for i, fingerprint, x in _read_spill_file(source):
+            if fingerprint not in fingerprints:
+                fingerprints.add(fingerprint)
+                dump((i, x), f, protocol)
+    os.remove(source)
+
+
+class sset(MutableSet):
+    """
+        Set that preserves ordering.
+
+        :Example:
+
+            >>> s = sset([3, 1, 2, 1])
+            >>> s
+            sset([3, 1, 2])
+            >>> s | sset([4, 3])
+            sset([3, 1, 2, 4])
+            >>> s & sset([2, 3]), s - {1}, s ^ {1, 5}
+            (sset([3, 2]), sset([3, 2]), sset([3, 2, 5]))
+            >>> s.union([5], [6])
+            sset([3, 1, 2, 5, 6])
+
+        Items are stored as the keys of a dict, which keeps insertion order,
+        so it uses about as much memory as a regular set.
+    """
+
+    __slots__ = ('_items', '__weakref__')
+
+    def __init__(self, iterable=None):
+        self._items = {} if iterable is None else dict.fromkeys(iterable)
+
+    @classmethod
+    def _from_iterable(cls, iterable):
+        return cls(iterable)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def add(self, key):
+        self._items[key] = None
+
+    def discard(self, key):
+        self._items.pop(key, None)
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __reversed__(self):
+        try:
+            return reversed(self._items)
+        except TypeError:  # dicts are reversible since Python 3.8
+            return reversed(list(self._items))
+
+    def pop(self, last=True):
+        if not self._items:
+            raise KeyError('set is empty')
+        if last:
+            return self._items.popitem()[0]
+        key = next(iter(self._items))
+        del self._items[key]
+        return key
+
+    def clear(self):
+        self._items.clear()
+
+    def copy(self):
+        new = self.__class__()
+        new._items = self._items.copy()
+        return new
+
+    __copy__ = copy
+
+    def __reduce__(self):
+        return (self.__class__, (list(self._items),))
+
+    def update(self, *iterables):
+        """
+            Add the items of all the iterables.
+        """
+        items = self._items
+        for iterable in iterables:
+            items.update(dict.fromkeys(iterable))
+
+    def union(self, *iterables):
+        new = self.copy()
+        new.update(*iterables)
+        return new
+
+    def intersection(self, *iterables):
+        keys = self._items
+        for iterable in iterables:
+            other = iterable if isinstance(iterable, Set) else set(iterable)
+            keys = [k for k in keys if k in other]
+        return self._from_iterable(keys)
+
+    def difference(self, *iterables):
+        new = self.copy()
+        new.difference_update(*iterables)
+        return new
+
+    def symmetric_difference(self, iterable):
+        new = self.copy()
+        new.symmetric_difference_update(iterable)
+        return new
+
+    def intersection_update(self, *iterables):
+        self._items = self.intersection(*iterables)._items
+
+    def difference_update(self, *iterables):
+        pop = self._items.pop
+        for iterable in iterables:
+            if iterable is self:
+                self.clear()
+                continue
+            for key in iterable:
+                pop(key, None)
+
+    def symmetric_difference_update(self, iterable):
+        items = self._items
+        for key in dict.fromkeys(iterable):
+            if key in items:
+                del items[key]
+            else:
+                items[key] = None
+
+    def __or__(self, other):
+        if not isinstance(other, Set):
+            return NotImplemented
+        return self.union(other)
+
+    def __ror__(self, other):
+        if not isinstance(other, Set):
+            return NotImplemented
+        return self._from_iterable(other).union(self)
+
+    def __and__(self, other):
+        if not isinstance(other, Set):
+            return NotImplemented
+        return self.intersection(other)
+
+    def __rand__(self, other):
+        if not isinstance(other, Set):
+            return NotImplemented
+        return self._from_iterable(other).intersection(self)
+
+    def __sub__(self, other):
+        if not isinstance(other, Set):
+            return NotImplemented
+        return self.difference(other)
+
+    def __rsub__(self, other):
+        if not isinstance(other, Set):
+            return NotImplemented
+        return self._from_iterable(other).difference(self)
+
+    def __xor__(self, other):
+        if not isinstance(other, Set):
+            return NotImplemented
+        return self.symmetric_difference(other)
+
+    def __rxor__(self, other):
+        if not isinstance(other, Set):
+            return NotImplemented
+        return self._from_iterable(other).symmetric_difference(self)
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def __iand__(self, other):
+        self.intersection_update(other)
+        return self
+
+    def __isub__(self, other):
+        if other is self:
+            self.clear()
+        else:
+            self.difference_update(other)
+        return self
+
+    def __ixor__(self, other):
+        if other is self:
+            self.clear()
+        else:
+            self.symmetric_difference_update(other)
+        return self
+
+    def __repr__(self):
+        if not self:
+            return '%s()' % (self.__class__.__name__,)
+        return '%s(%r)' % (self.__class__.__name__, list(self))
 
+    def __eq__(self, other):
+        # order matters between ordered sets, like in IndexedSSet.__eq__
+        if isinstance(other, (sset, IndexedSSet)):
+            return len(self) == len(other) and list(self) == list(other)
+        return set(self) == set(other)
 
-KEY, PREV, NEXT = range(3)
+    __hash__ = None
 
 
-class sset(MutableSet):
+class IndexedSSet(MutableSet):
     """
-        Set that preserves ordering.
+        Set that preserves ordering, and that you can index like a list.
 
-        From http://code.activestate.com/recipes/576694/
+        :Example:
+
+            >>> s = IndexedSSet('abcde')
+            >>> s[1], s[-1], s[1:3], s.index('d')
+            ('b', 'e', ['b', 'c'], 3)
+            >>> s.pop(0), s.pop()
+            ('a', 'e')
+            >>> del s[0]
+            >>> s
+            IndexedSSet(['c', 'd'])
+
+        Items are stored in blocks of at most LOAD items, and a binary
+        indexed tree keeps track of the size of the blocks, so getting,
+        deleting or finding the position of an item is O(log n) instead
+        of O(n) with sset. Adding an item and checking if it's in the set
+        are O(1).
+
+        The index and the blocks are rebuilt when a block is created or
+        removed, which happens at most once every LOAD operations.
     """
 
+    LOAD = 1000
+
+    __slots__ = ('_blocks', '_where', '_tree', '_positions', '__weakref__')
+
     def __init__(self, iterable=None):
-        self.end = end = []
-        end += [None, end, end]         # sentinel node for doubly linked list
-        self.map = {}                   # key --> [key, prev, next]
+        self._blocks = []  # lists of items, in order
+        self._where = {}   # item -> block containing it
+        self._reset()
         if iterable is not None:
-            self |= iterable
+            self.update(iterable)
+
+    def _reset(self):
+        # called when blocks are added or removed: the index and the
+        # position of each block will be rebuilt on demand
+        self._tree = None
+        self._positions = None
+
+    def _get_tree(self):
+        tree = self._tree
+        if tree is None:
+            # binary indexed tree of the block sizes, built in O(n)
+            tree = [0]
+            tree.extend(len(block) for block in self._blocks)
+            size = len(tree)
+            for i in range(1, size):
+                parent = i + (i & -i)
+                if parent < size:
+                    tree[parent] += tree[i]
+            self._tree = tree
+        return tree
+
+    def _tree_add(self, block_index, delta):
+        tree = self._tree
+        if tree is None:
+            return
+        i = block_index + 1
+        size = len(tree)
+        while i < size:
+            tree[i] += delta
+            i += i & -i
+
+    def _offset(self, block_index):
+        """
+            Returns the number of items in the blocks before this one.
+        """
+        tree = self._get_tree()
+        total = 0
+        i = block_index
+        while i > 0:
+            total += tree[i]
+            i -= i & -i
+        return total
+
+    def _locate(self, index):
+        """
+            Returns the index of the block containing the item at the
+            given position, and the position of the item in the block.
+        """
+        tree = self._get_tree()
+        size = len(tree)
+        block_index = 0
+        step = 1 << (size.bit_length() - 1)
+        while step:
+            i = block_index + step
+            if i < size and tree[i] <= index:
+                index -= tree[i]
+                block_index = i
+            step >>= 1
+        return block_index, index
+
+    def _block_index(self, block):
+        positions = self._positions
+        if positions is None:
+            positions = self._positions = dict(
+                (id(b), i) for i, b in enumerate(self._blocks)
+            )
+        return positions[id(block)]
+
+    def _normalize_index(self, index):
+        size = len(self._where)
+        if index < 0:
+            index += size
+        if not 0 <= index < size:
+            raise IndexError('%s index out of range' % self.__class__.__name__)
+        return index
+
+    def _remove_at(self, block_index, position):
+        block = self._blocks[block_index]
+        key = block.pop(position)
+        del self._where[key]
+        if block:
+            self._tree_add(block_index, -1)
+        else:
+            del self._blocks[block_index]
+            self._reset()
+        return key
 
     def __len__(self):
-        return len(self.map)
+        return len(self._where)
 
     def __contains__(self, key):
-        return key in self.map
+        return key in self._where
+
+    def __iter__(self):
+        return chain.from_iterable(self._blocks)
+
+    def __reversed__(self):
+        for block in reversed(self._blocks):
+            for key in reversed(block):
+                yield key
 
     def add(self, key):
-        if key not in self.map:
-            end = self.end
-            curr = end[PREV]
-            curr[NEXT] = end[PREV] = self.map[key] = [key, curr, end]
+        if key in self._where:
+            return
+        blocks = self._blocks
+        if not blocks or len(blocks[-1]) >= self.LOAD:
+            blocks.append([])
+            self._reset()
+        else:
+            self._tree_add(len(blocks) - 1, 1)
+        block = blocks[-1]
+        block.append(key)
+        self._where[key] = block
+
+    def update(self, *iterables):
+        """
+            Add the items of all the iterables.
+        """
+        where = self._where
+        blocks = self._blocks
+        load = self.LOAD
+        for iterable in iterables:
+            keys = [k for k in dict.fromkeys(iterable) if k not in where]
+            if not keys:
+                continue
+            start = 0
+            if blocks and len(blocks[-1]) < load:
+                start = load - len(blocks[-1])
+                blocks[-1].extend(keys[:start])
+                where.update(dict.fromkeys(keys[:start], blocks[-1]))
+            for i in range(start, len(keys), load):
+                block = keys[i:i + load]
+                blocks.append(block)
+                where.update(dict.fromkeys(block, block))
+            self._reset()
 
     def discard(self, key):
-        if key in self.map:
-            key, prev, next = self.map.pop(key)
-            prev[NEXT] = next
-            next[PREV] = prev
+        block = self._where.get(key)
+        if block is not None:
+            self._remove_at(self._block_index(block), block.index(key))
 
-    def __iter__(self):
-        end = self.end
-        curr = end[NEXT]
-        while curr is not end:
-            yield curr[KEY]
-            curr = curr[NEXT]
+    def clear(self):
+        self._blocks = []
+        self._where = {}
+        self._reset()
 
-    def __reversed__(self):
-        end = self.end
-        curr = end[PREV]
-        while curr is not end:
-            yield curr[KEY]
-            curr = curr[PREV]
+    def index(self, key):
+        """
+            Returns the position of the item in the set.
+        """
+        try:
+            block = self._where[key]
+        except KeyError:
+            raise ValueError('%r is not in %s' % (key, self.__class__.__name__))
+        return self._offset(self._block_index(block)) + block.index(key)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1 or start >= stop:
+                return [self[i] for i in range(start, stop, step)]
+            block_index, position = self._locate(start)
+            items = chain(islice(self._blocks[block_index], position, None),
+                          chain.from_iterable(islice(self._blocks,
+                                                     block_index + 1, None)))
+            return list(islice(items, stop - start))
+
+        block_index, position = self._locate(self._normalize_index(index))
+        return self._blocks[block_index][position]
+
+    def __delitem__(self, index):
+        if isinstance(index, slice):
+            for key in self[index]:
+                self.discard(key)
+        else:
+            block_index, position = self._locate(self._normalize_index(index))
+            self._remove_at(block_index, position)
 
-    def pop(self, last=True):
-        if not self:
+    def pop(self, index=-1):
+        """
+            Remove the item at this position, the last one by default,
+            and returns it.
+        """
+        if not self._where:
             raise KeyError('set is empty')
-        key = next(reversed(self)) if last else next(iter(self))
-        self.discard(key)
-        return key
+        block_index, position = self._locate(self._normalize_index(index))
+        return self._remove_at(block_index, position)
+
+    def __reduce__(self):
+        return (self.__class__, (list(self),))
 
     def __repr__(self):
         if not self:
@@ -655,12 +2881,138 @@ class sset(MutableSet):
         return '%s(%r)' % (self.__class__.__name__, list(self))
 
     def __eq__(self, other):
-        if isinstance(other, sset):
+        if isinstance(other, (sset, IndexedSSet)):
             return len(self) == len(other) and list(self) == list(other)
         return set(self) == set(other)
 
-    def __del__(self):
-        self.clear()   # remove circular references
+    __hash__ = None
+
+
+class SortedIndexedSSet(IndexedSSet):
+    """
+        IndexedSSet keeping its items sorted instead of in insertion order.
+
+        :Example:
+
+            >>> s = SortedIndexedSSet([5, 1, 3, 1])
+            >>> s
+            SortedIndexedSSet([1, 3, 5])
+            >>> s.add(4)
+            >>> s[2], s.index(5), s.bisect_left(2), s.bisect_right(5)
+            (4, 3, 1, 4)
+
+        Items are inserted at their place using bisect, in O(log n) plus
+        the cost of inserting in a block of at most 2 * LOAD items.
+    """
+
+    __slots__ = ('_maxes',)
+
+    def __init__(self, iterable=None):
+        self._maxes = []  # last item of each block
+        super(SortedIndexedSSet, self).__init__(iterable)
+
+    def _find_block(self, key):
+        block_index = bisect_left(self._maxes, key)
+        if block_index == len(self._blocks):
+            block_index -= 1
+        return block_index
+
+    def _remove_at(self, block_index, position):
+        block = self._blocks[block_index]
+        if len(block) == 1:
+            del self._maxes[block_index]
+        elif position == len(block) - 1:
+            self._maxes[block_index] = block[-2]
+        return super(SortedIndexedSSet, self)._remove_at(block_index, position)
+
+    def add(self, key):
+        where = self._where
+        if key in where:
+            return
+
+        blocks = self._blocks
+        if not blocks:
+            block = [key]
+            blocks.append(block)
+            self._maxes.append(key)
+            where[key] = block
+            self._reset()
+            return
+
+        block_index = self._find_block(key)
+        block = blocks[block_index]
+        insort(block, key)
+        self._maxes[block_index] = block[-1]
+        where[key] = block
+
+        if len(block) > 2 * self.LOAD:
+            half = block[self.LOAD:]
+            del block[self.LOAD:]
+            blocks.insert(block_index + 1, half)
+            self._maxes[block_index] = block[-1]
+            self._maxes.insert(block_index + 1, half[-1])
+            where.update(dict.fromkeys(half, half))
+            self._reset()
+        else:
+            self._tree_add(block_index, 1)
+
+    def update(self, *iterables):
+        where = self._where
+        keys = [k for iterable in iterables for k in iterable if k not in where]
+        if len(keys) < max(len(where) // 8, 1):
+            for key in keys:
+                self.add(key)
+            return
+
+        # a lot of new items: sort everything at once and rebuild the blocks
+        keys = sorted(set(keys).union(where))
+        load = self.LOAD
+        self._blocks = blocks = [keys[i:i + load]
+                                 for i in range(0, len(keys), load)]
+        self._maxes = [block[-1] for block in blocks]
+        self._where = where = {}
+        for block in blocks:
+            where.update(dict.fromkeys(block, block))
+        self._reset()
+
+    def discard(self, key):
+        if key in self._where:
+            block_index = self._find_block(key)
+            position = bisect_left(self._blocks[block_index], key)
+            self._remove_at(block_index, position)
+
+    def clear(self):
+        super(SortedIndexedSSet, self).clear()
+        self._maxes = []
+
+    def index(self, key):
+        if key not in self._where:
+            raise ValueError('%r is not in %s' % (key, self.__class__.__name__))
+        block_index = self._find_block(key)
+        position = bisect_left(self._blocks[block_index], key)
+        return self._offset(block_index) + position
+
+    def bisect_left(self, key):
+        """
+            Returns the position where the item would be inserted, before
+            any equal item.
+        """
+        block_index = bisect_left(self._maxes, key)
+        if block_index == len(self._blocks):
+            return len(self)
+        return (self._offset(block_index) +
+                bisect_left(self._blocks[block_index], key))
+
+    def bisect_right(self, key):
+        """
+            Returns the position where the item would be inserted, after
+            any equal item.
+        """
+        block_index = bisect_right(self._maxes, key)
+        if block_index == len(self._blocks):
+            return len(self)
+        return (self._offset(block_index) +
+                bisect_right(self._blocks[block_index], key))
 
 
 def add_to_pythonpath(path, starting_point='.', insertion_index=None):
@@ -698,6 +3050,239 @@ def add_to_pythonpath(path, starting_point='.', insertion_index=None):
             sys.path.insert(insertion_index, path)
 
 
+WRITE_BUFFER_SIZE = 1024 * 1024
+WRITE_BATCH_SIZE = 10000
+
+
+class Writer(object):
+    r"""
+        Context manager to write lines to a file, fast.
+
+        :Example:
+
+            with Writer('/tmp/test.txt.gz', atomic=True) as writer:
+                writer.write('header')
+                writer.write_lines(str(i) for i in range(1000000))
+
+        Lines are converted the same way than with write(), then written
+        by batches of `batch_size` through a buffer of WRITE_BUFFER_SIZE
+        bytes. Files ending with ".gz", ".bz2" or ".xz" are compressed.
+
+        You can optionally pass :
+
+        mode : among 'a', 'w', which default to 'w'.
+        encoding : which default to utf8 and will condition decoding AND encoding
+        errors : what to do when en encoding error occurs : 'replace' by default,
+                which replace faulty caracters with '?'
+        atomic : if True, write to a temporary file in the same directory
+                 and replace the file with it only if no exception is
+                 raised, so the file is never half written. Can't be
+                 used with mode='a'. The permissions of the existing file
+                 are kept. A new file gets the default permissions if
+                 the umask can be read from /proc (Linux), and is only
+                 readable by its owner otherwise.
+        fsync : False by default. True to call os.fsync() when closing
+                the file, or 'always' to also call it after each batch.
+    """
+
+    def __init__(self, path, mode='w', encoding='utf8', errors='replace',
+                 atomic=False, fsync=False, batch_size=WRITE_BATCH_SIZE):
+
+        if mode not in ('w', 'a'):
+            raise ValueError("mode must be 'w' or 'a', not %r" % mode)
+        if atomic and mode == 'a':
+            raise ValueError("Atomic writes can't append to a file")
+        if fsync not in (False, True, 'always'):
+            raise ValueError("fsync must be False, True or 'always'")
+
+        self.path = path
+        self.mode = mode
+        self.encoding = encoding
+        self.errors = errors
+        self.atomic = atomic
+        self.fsync = fsync
+        self.batch_size = batch_size
+
+        self.file = self.raw_file = self.tmp_path = None
+
+
+    def open(self):
+        """
+            Open the file. Called automatically by the `with` statement.
+        """
+        path = self.path
+        if self.atomic:
+            directory, name = os.path.split(os.path.abspath(os.fsdecode(path)))
+            fd, path = tempfile.mkstemp(prefix='.%s.' % name, suffix='.tmp',
+                                        dir=directory)
+            os.close(fd)
+            self.tmp_path = path
+            _copy_permissions(self.path, path)
+
+        self.raw_file = io.open(path, self.mode + 'b', WRITE_BUFFER_SIZE)
+        compression = get_compression(self.path)
+        if compression:
+            self.file = open_file(self.raw_file, self.mode, self.encoding,
+                                  self.errors, newline='', compression=compression)
+        else:
+            self.file = io.TextIOWrapper(self.raw_file, self.encoding,
+                                         self.errors, newline='')
+        return self
+
+
+    def format(self, line):
+        """
+            Turn the value into a line of text.
+        """
+        if isinstance(line, bytes):
+            line = line.decode(self.encoding, self.errors)
+
+        if not isinstance(line, str):
+            line = repr(line)
+
+        return line + os.linesep
+
+
+    def write(self, *lines):
+        """
+            Write each argument as a line.
+        """
+        self.write_lines(lines)
+
+
+    def write_lines(self, iterable):
+        """
+            Write each item of the iterable as a line, and returns the
+            number of lines written.
+        """
+        if self.file is None:
+            raise ValueError('The file is not opened')
+
+        writelines = self.file.writelines
+        always_sync = self.fsync == 'always'
+        count = 0
+        for batch in chunks(map(self.format, iterable), self.batch_size,
+                            process=None):
+            writelines(batch)
+            count += len(batch)
+            if always_sync:
+                self.sync()
+        return count
+
+
+    def sync(self):
+        """
+            Flush the buffers and make sure the data is written on disk.
+        """
+        self.file.flush()
+        self.raw_file.flush()
+        os.fsync(self.raw_file.fileno())
+
+
+    def close(self, discard=False):
+        """
+            Close the file. Called automatically at the end of the `with`
+            statement.
+
+            In atomic mode, the file is then replaced with what was written,
+            unless `discard` is True, in which case what was written is
+            removed. If an exception is raised in the `with` block, this
+            is done for you.
+        """
+        if self.file is None:
+            return
+
+        try:
+            if isinstance(self.file, io.TextIOWrapper) and \
+                    self.file.buffer is self.raw_file:
+                self.file.flush()
+                self.file.detach()
+            else:
+                self.file.close()  # writes the end of the compressed stream
+            self.raw_file.flush()
+            if self.fsync and not discard:
+                os.fsync(self.raw_file.fileno())
+        finally:
+            self.raw_file.close()
+            self.file = self.raw_file = None
+
+        if self.tmp_path is None:
+            return
+
+        tmp_path, self.tmp_path = self.tmp_path, None
+        if discard:
+            os.remove(tmp_path)
+            return
+
+        os.replace(tmp_path, self.path)
+        if self.fsync:
+            _fsync_directory(os.path.dirname(os.path.abspath(self.path)))
+
+
+    def __enter__(self):
+        return self.open()
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(discard=exc_type is not None)
+
+
+def _copy_permissions(source, destination):
+    # mkstemp creates files only readable by the owner
+    try:
+        shutil.copymode(source, destination)
+        return
+    except OSError:
+        pass
+    umask = _get_umask()
+    if umask is not None:
+        os.chmod(destination, 0o666 & ~umask)
+
+
+def _get_umask():
+    # os.umask() can only read the umask by changing it, which would
+    # affect the files created by other threads in the meantime
+    try:
+        with io.open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('Umask:'):
+                    return int(line.split()[1], 8)
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def _fsync_directory(path):
+    # make sure the new name of the file is on disk too
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:  # not possible on Windows
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def write_lines(path, iterable, **kwargs):
+    r"""
+        Write each item of `iterable` as a line in the file at `path`,
+        and returns the number of lines written.
+
+        It accepts the same parameters than Writer, and is much faster
+        than write() for a lot of lines.
+
+        :Example:
+
+            write_lines('/tmp/test.txt.gz', (str(i) for i in range(1000000)),
+                        atomic=True)
+    """
+    with Writer(path, **kwargs) as writer:
+        return writer.write_lines(iterable)
+
+
 def write(path, *args, **kwargs):
     r"""
         Try to write to the file at `path` the values passed as `args` as lines.
@@ -712,7 +3297,7 @@ def write(path, *args, **kwargs):
 
             s = '/tmp/test'
             write(s, 'test', '\xe9', 1, ['fdjskl'])
-            print open(s).read()
+            print(open(s).read())
             test
             \xe9
             1
@@ -720,7 +3305,7 @@ def write(path, *args, **kwargs):
 
         You can optionally pass :
 
-        mode : among 'a', 'w', which default to 'w'. Binary mode is forced.
+        mode : among 'a', 'w', which default to 'w'.
         encoding : which default to utf8 and will condition decoding AND encoding
         errors : what to do when en encoding error occurs : 'replace' by default,
                 which replace faulty caracters with '?'
@@ -728,23 +3313,226 @@ def write(path, *args, **kwargs):
         You can pass string or unicode as *args, but if you pass strings,
         make sure you pass them with the same encoding you wish to write to
         the file.
+
+        It also accepts the other parameters of Writer, and if you have a lot
+        of lines, see write_lines().
+    """
+    write_lines(path, args, **kwargs)
+
+
+READ_BLOCK_SIZE = 1024 * 1024
+
+
+def _is_ascii_compatible(encoding):
+    # we cut the raw bytes on b'\n', which is not possible with utf16 & co
+    try:
+        return '\n'.encode(encoding) == b'\n'
+    except LookupError:
+        return False
+
+
+def _map_file(fileobj):
+    try:
+        return mmap(fileobj.fileno(), 0, access=ACCESS_READ)
+    except (ValueError, OSError, io.UnsupportedOperation):
+        # empty files, pipes, special files...
+        return None
+
+
+def _line_aligned_blocks(fileobj, start, end, block_size):
+    """
+        Yield blocks of bytes from the file, between `start` and `end`,
+        each of them ending at the end of a line.
+    """
+    data = _map_file(fileobj)
+
+    if data is not None:
+        try:
+            end = len(data) if end is None else min(end, len(data))
+            find, rfind = data.find, data.rfind
+            while start < end:
+                stop = start + block_size
+                if stop < end:
+                    cut = rfind(b'\n', start, stop)
+                    if cut == -1:  # line longer than the block
+                        cut = find(b'\n', stop, end)
+                    stop = end if cut == -1 else cut + 1
+                else:
+                    stop = end
+                yield data[start:stop]
+                start = stop
+        finally:
+            data.close()
+        return
+
+    fileobj.seek(start)
+    remaining = None if end is None else end - start
+    leftover = b''
+    while remaining is None or remaining > 0:
+        size = block_size if remaining is None else min(block_size, remaining)
+        block = fileobj.read(size)
+        if not block:
+            break
+        if remaining is not None:
+            remaining -= len(block)
+        block = leftover + block
+        cut = block.rfind(b'\n') + 1
+        if cut:
+            yield block[:cut]
+        leftover = block[cut:]
+    if leftover:
+        yield leftover
+
+
+def _split_block(text):
+    if '\r' in text:
+        text = text.replace('\r\n', '\n')
+    lines = text.split('\n')
+    if not lines[-1]:
+        lines.pop()
+    return lines
+
+
+def read_lines(path, encoding='utf8', errors='strict', start=0, end=None,
+               block_size=READ_BLOCK_SIZE):
+    r"""
+        Lazily yield the lines of the file at `path`, without the line
+        endings.
+
+        :Example:
+
+            >>> tmp = tempfile.TemporaryDirectory()
+            >>> path = os.path.join(tmp.name, 'test.txt')
+            >>> write(path, 'foo', 'bar', 'é')
+            >>> list(read_lines(path))
+            ['foo', 'bar', 'é']
+            >>> tmp.cleanup()
+
+        Instead of decoding each line separatly, the file is memory mapped
+        and decoded by blocks of `block_size` bytes, which is much faster
+        on big files. Lines end with "\n" or "\r\n".
+
+        `start` and `end` are offsets in bytes to read only a part of the
+        file. `start` must be at the beginning of a line: use split_file()
+        to get them.
+
+        Files ending with ".gz", ".bz2" or ".xz" are decompressed
+        transparently, but can't be read by range.
     """
+    if get_compression(path) or not _is_ascii_compatible(encoding):
+        if start or end is not None:
+            raise ValueError("Can't read a range of lines from %r" % path)
+        with open_file(path, encoding=encoding, errors=errors) as f:
+            for line in f:
+                if line.endswith('\n'):
+                    line = line[:-1]
+                yield line
+        return
+
+    with io.open(path, 'rb') as f:
+        for block in _line_aligned_blocks(f, start, end, block_size):
+            for line in _split_block(block.decode(encoding, errors)):
+                yield line
+
+
+def tail_lines(path, n=10, encoding='utf8', errors='strict',
+               block_size=64 * 1024):
+    r"""
+        Return a list of the last `n` lines of the file at `path`, without
+        the line endings.
 
-    mode = kwargs.get('mode', 'w')
-    encoding = kwargs.get('encoding', 'utf8')
-    errors = kwargs.get('encoding', 'replace')
+        :Example:
+
+            >>> tmp = tempfile.TemporaryDirectory()
+            >>> path = os.path.join(tmp.name, 'test.txt')
+            >>> write(path, *range(1000))
+            >>> tail_lines(path, 3)
+            ['997', '998', '999']
+            >>> tmp.cleanup()
+
+        The file is read backward from the end by blocks of `block_size`
+        bytes, so it doesn't matter how big it is. Compressed files can't
+        be read backward and are read entirely.
+    """
+    if n <= 0:
+        return []
+
+    if get_compression(path) or not _is_ascii_compatible(encoding):
+        return list(deque(read_lines(path, encoding, errors), maxlen=n))
+
+    with io.open(path, 'rb') as f:
+        position = f.seek(0, io.SEEK_END)
+        blocks = []
+        newlines = 0
+        # n + 1 line endings are needed for n complete lines
+        while position > 0 and newlines <= n:
+            size = min(block_size, position)
+            position -= size
+            f.seek(position)
+            block = f.read(size)
+            blocks.append(block)
+            newlines += block.count(b'\n')
+
+    data = b''.join(reversed(blocks))
+    if position > 0:
+        # drop the beginning of the first line, which may also start in
+        # the middle of a character
+        data = data[data.index(b'\n') + 1:]
+
+    return _split_block(data.decode(encoding, errors))[-n:]
+
+
+def split_file(path, n):
+    """
+        Return up to `n` (start, end) tuples of offsets in bytes splitting
+        the file at `path` in parts of about the same size, each starting at
+        the beginning of a line.
 
-    with codecs.open(path, mode=mode, encoding=encoding, errors=errors) as f:
+        Pass them to read_lines() to process one file with several workers
+        in parallel:
 
-        for line in args:
+        :Example:
 
-            if isinstance(line, bytes):
-                line = line.decode(encoding, errors)
+            >>> tmp = tempfile.TemporaryDirectory()
+            >>> path = os.path.join(tmp.name, 'test.txt')
+            >>> write(path, *range(1000))
+            >>> ranges = split_file(path, 4)
+            >>> lines = chain.from_iterable(
+            ...     read_lines(path, start=start, end=end)
+            ...     for start, end in ranges
+            ... )
+            >>> list(lines) == [str(i) for i in range(1000)]
+            True
+            >>> tmp.cleanup()
+
+        Compressed files can't be split.
+    """
+    if get_compression(path):
+        raise ValueError("Can't split the compressed file %r" % path)
 
-            if not isinstance(line, unicode):
-                line = repr(line)
+    if n < 1:
+        raise ValueError('n must be at least 1, not %r' % n)
 
-            f.write(line + os.linesep)
+    with io.open(path, 'rb') as f:
+        size = f.seek(0, io.SEEK_END)
+        data = _map_file(f)
+        if data is None:
+            return [(0, size)] if size else []
+        try:
+            boundaries = [0]
+            for i in range(1, n):
+                # go to the end of the line containing the target offset
+                cut = data.find(b'\n', max(size * i // n, boundaries[-1]))
+                if cut == -1:
+                    break
+                if cut + 1 < size:
+                    boundaries.append(cut + 1)
+        finally:
+            data.close()
+
+    boundaries.append(size)
+    return [(start, end) for start, end in zip(boundaries, boundaries[1:])
+            if start < end]
 
 
 class Flattener(object):
@@ -753,24 +3541,29 @@ class Flattener(object):
         structures to iterate over the items as it if it were a flat iterable.
 
         The flattener returns a generator that lazily yield the items and
-        deals with up to hundred of levels of nesting (~800 on my machine,
-        and you can control it with sys.setrecursionlimit).
+        deals with any level of nesting, as it doesn't use recursion.
 
         A default flattener named 'flatten' is available by default.
 
         :Example:
 
-            a = []
-            for i in range(10):
-                a = [a, i]
-            print(a)
-
+            >>> a = []
+            >>> for i in range(10):
+            ...     a = [a, i]
+            >>> print(a)
             [[[[[[[[[[[], 0], 1], 2], 3], 4], 5], 6], 7], 8], 9]
 
-            print(list(flatten(a)))
-
+            >>> print(list(flatten(a)))
             [0, 1, 2, 3, 4, 5, 6, 7, 8, 9]
 
+        You can limit the number of levels to flatten with max_depth, either
+        while creating the flattener or calling it:
+
+        :Example:
+
+            >>> list(flatten([1, [2, [3, [4]]]], max_depth=1))
+            [1, 2, [3, [4]]]
+
         By default, it flattens all the types listed in
         Flattener.DEFAULT_FLATTEN_TYPES but you can pass you list via
         flatten_types while calling a Flatener instance.
@@ -797,6 +3590,10 @@ class Flattener(object):
 
             [0, u'a', 1.0, u'b', u'c', 3.0, 1, u'a', 1.0, u'b', u'c', 3.0]
 
+        Unless you override should_flatten(), the decision to flatten an
+        object or not is made once per type then cached, and lists or tuples
+        containing only items that should not be flattened are yielded
+        from in one go.
     """
 
     DEFAULT_FLATTEN_TYPES = (
@@ -804,16 +3601,20 @@ class Flattener(object):
         tuple,
         set,
         (x for x in ()).__class__,
-        xrange,
+        range,
         deque,
         MutableSet,
         # Sequence # warning, a string is a subclass of Sequence
     )
 
 
-    def __init__(self, flatten_types=None, iterable_getters={}):
+    def __init__(self, flatten_types=None, iterable_getters={},
+                 max_depth=None):
         self.flatten_types = flatten_types or self.DEFAULT_FLATTEN_TYPES
         self.iterable_getters = iterable_getters
+        self.max_depth = max_depth
+        self._decisions = {}
+        self._decisions_types = self.flatten_types
 
 
     def should_flatten(self, obj):
@@ -848,18 +3649,440 @@ class Flattener(object):
         return obj
 
 
-    def __call__(self, iterable):
+    def _get_decisions(self):
+        """
+            Return the cache of should_flatten() results by type, or None
+            if should_flatten() has been overridden and may not depend on
+            the type only.
+        """
+        if type(self).should_flatten is not Flattener.should_flatten:
+            return None
+        if self._decisions_types is not self.flatten_types:
+            self._decisions = {}
+            self._decisions_types = self.flatten_types
+        return self._decisions
+
+
+    def __call__(self, iterable, max_depth=_NOTHING):
         """
             Returns a generator yieling items from a deeply nested iterable
             like it would be a flat one.
         """
-        for e in iterable:
-            if self.should_flatten(e):
-                for f in self(self.transform_iterable(e)):
-                    yield f
+        if max_depth is _NOTHING:
+            max_depth = self.max_depth
+
+        flatten_types = self.flatten_types
+        decisions = self._get_decisions()
+        should_flatten = self.should_flatten
+        transform = self.transform_iterable
+
+        stack = [iter(iterable)]
+        push = stack.append
+        pop = stack.pop
+
+        while stack:
+            for e in stack[-1]:
+
+                if decisions is None:
+                    flat = should_flatten(e)
+                else:
+                    cls = type(e)
+                    try:
+                        flat = decisions[cls]
+                    except KeyError:
+                        flat = decisions[cls] = issubclass(cls, flatten_types)
+
+                if not flat or (max_depth is not None and
+                                len(stack) > max_depth):
+                    yield e
+                    continue
+
+                e = transform(e)
+
+                # shortcut for the containers at the bottom of the nesting
+                cls = type(e)
+                if (cls is list or cls is tuple) and decisions is not None:
+                    leaf_types = set(map(type, e))
+                    for leaf_type in leaf_types:
+                        if leaf_type not in decisions:
+                            decisions[leaf_type] = issubclass(leaf_type,
+                                                              flatten_types)
+                        if decisions[leaf_type]:
+                            break
+                    else:
+                        for leaf in e:
+                            yield leaf
+                        continue
+
+                push(iter(e))
+                break
             else:
-                yield e
+                pop()
 
 
 
 flatten = Flattener()
+
+
+PATH_CACHE_SIZE = 100000
+
+
+class PathCache(object):
+    r"""
+        Join and split paths such as "a.b.0.c", keeping the results in
+        bounded LRU caches so that data sharing the same structure reuse
+        the same strings instead of building them again and again.
+
+        It's used by flatten_paths() and unflatten(), with one instance
+        per separator.
+
+        :Example:
+
+            >>> cache = PathCache('/')
+            >>> cache.join(cache.join(None, 'a'), 0)
+            'a/0'
+            >>> cache.split('a/0/01')
+            ('a', 0, '01')
+
+        Segments that are integers are turned into int when splitting.
+    """
+
+    def __init__(self, separator='.', cache_size=PATH_CACHE_SIZE):
+        self.separator = separator
+        self.cache_size = cache_size
+        # typed, or True and 1 would share the same path
+        self.join = lru_cache(maxsize=cache_size, typed=True)(self._join)
+        self.split = lru_cache(maxsize=cache_size)(self._split)
+
+
+    def _join(self, prefix, key):
+        if prefix is None:
+            return str(key)
+        return prefix + self.separator + str(key)
+
+
+    def _split(self, path):
+        segments = []
+        for segment in path.split(self.separator):
+            # only canonical integers, so that "01" can be rebuilt
+            if segment.isdigit() and str(int(segment)) == segment:
+                segment = int(segment)
+            segments.append(segment)
+        return tuple(segments)
+
+
+_path_caches = {}
+
+
+def get_path_cache(separator='.'):
+    """
+        Return the PathCache shared by all the calls using this separator.
+    """
+    try:
+        return _path_caches[separator]
+    except KeyError:
+        cache = _path_caches[separator] = PathCache(separator)
+        return cache
+
+
+def _iter_children(container):
+    if isinstance(container, dict):
+        return iter(container.items())
+    return enumerate(container)
+
+
+def flatten_paths(data, sep='.'):
+    """
+        Lazily yield (path, value) for each leaf of nested dicts and
+        lists, the path being the keys and indices joined with `sep`.
+
+        :Example:
+
+            >>> data = {'a': {'b': [{'c': 1}, 2]}, 'd': [], 'e': None}
+            >>> for path, value in flatten_paths(data):
+            ...     print(path, value)
+            a.b.0.c 1
+            a.b.1 2
+            d []
+            e None
+
+        Empty dicts and lists are considered leaves, so unflatten() can
+        rebuild them. Nesting depth is not limited by the recursion limit.
+    """
+    join = get_path_cache(sep).join
+    stack = [(None, _iter_children(data))]
+    push = stack.append
+
+    while stack:
+        prefix, children = stack[-1]
+        for key, value in children:
+            path = join(prefix, key)
+            if isinstance(value, (dict, list, tuple)) and value:
+                push((path, _iter_children(value)))
+                break
+            yield path, value
+        else:
+            stack.pop()
+
+
+def _set_child(node, segment, value, path):
+    if isinstance(node, list):
+        if not isinstance(segment, int):
+            raise ValueError('%r uses %r as a list index' % (path, segment))
+        missing = segment - len(node)
+        if missing >= 0:
+            node.extend([None] * missing)
+            node.append(value)
+        else:
+            node[segment] = value
+    else:
+        node[str(segment) if isinstance(segment, int) else segment] = value
+    return value
+
+
+def _get_child(node, segment, container_type, path):
+    if isinstance(node, list):
+        if isinstance(segment, int) and segment < len(node):
+            child = node[segment]
+            if child is not None:
+                return child
+    else:
+        child = node.get(str(segment) if isinstance(segment, int)
+                         else segment, _NOTHING)
+        if child is not _NOTHING:
+            return child
+    return _set_child(node, segment, container_type(), path)
+
+
+def unflatten(mapping, sep='.'):
+    """
+        Rebuild nested dicts and lists from a mapping or an iterable of
+        (path, value), such as the ones from flatten_paths().
+
+        :Example:
+
+            >>> unflatten({'a.b.0.c': 1, 'a.b.1': 2, 'd': []})
+            {'a': {'b': [{'c': 1}, 2]}, 'd': []}
+            >>> data = {'a': [1, {'b': 2}], 'c': {}}
+            >>> unflatten(flatten_paths(data)) == data
+            True
+
+        Integer segments are turned into list indices, and missing items
+        in a list are filled with None. Keys containing `sep` or looking like
+        integers can't be told apart from nested paths, so they won't round
+        trip.
+    """
+    split = get_path_cache(sep).split
+    if isinstance(mapping, Mapping):
+        mapping = mapping.items()
+
+    root = None
+    for path, value in mapping:
+        segments = split(path)
+        if root is None:
+            root = [] if isinstance(segments[0], int) else {}
+
+        node = root
+        for segment, next_segment in zip(segments, segments[1:]):
+            container_type = list if isinstance(next_segment, int) else dict
+            node = _get_child(node, segment, container_type, path)
+            if not isinstance(node, (dict, list)):
+                raise ValueError('%r is inside the value %r' % (path, node))
+
+        _set_child(node, segments[-1], value, path)
+
+    return {} if root is None else root
+
+
+# name -> original function, while instrument() is on
+_instrumented = {}
+# name -> {'calls': int, 'items': int, 'time': float}
+_stats = {}
+_NOT_INSTRUMENTED = ('instrument', 'stats', 'reset_stats')
+# class -> methods instrumented as "Class.method"
+_INSTRUMENTED_METHODS = {
+    'Slugifier': ('__call__', 'slugify_many'),
+    'LazyImport': ('__getattr__', '__call__'),
+    'Writer': ('open', 'write', 'write_lines', 'sync', 'close'),
+}
+# helpers returning an iterator without being generator functions, which
+# get their items counted too
+_ITERATOR_HELPERS = ('normalize_stream', 'chunks', 'window', 'rolling',
+                     'rolling_var', 'rolling_min', 'rolling_max', 'flatten',
+                     'unpack', 'Slugifier.slugify_many')
+
+
+# calls made while an instrumented helper is running come from minibelt
+# itself, not from the user, so they are not recorded
+_instrumentation = threading.local()
+
+
+def _count_items(iterator, record):
+    state = _instrumentation
+    try:
+        while True:
+            active = getattr(state, 'active', False)
+            state.active = True
+            start = timer()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                record['time'] += timer() - start
+                state.active = active
+            record['items'] += 1
+            yield item
+    finally:
+        close = getattr(iterator, 'close', None)
+        if close is not None:
+            close()
+
+
+def _instrument_function(name, func, count_items=False):
+    record = _stats.setdefault(name, {'calls': 0, 'items': 0, 'time': 0.})
+    state = _instrumentation
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if getattr(state, 'active', False):
+            return func(*args, **kwargs)
+
+        record['calls'] += 1
+        state.active = True
+        start = timer()
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            record['time'] += timer() - start
+            state.active = False
+        # unpack() returns a tuple with as_tuple=True
+        if count_items and isinstance(result, Iterator):
+            return _count_items(result, record)
+        return result
+
+    return wrapper
+
+
+def instrument(enable=True, names=None):
+    """
+        Replace the helpers of this module with wrappers recording how many
+        times they are called, how many items the ones returning iterators
+        yield, and the total time spent in them. Read the figures with
+        stats().
+
+        :Example:
+
+            >>> import minibelt
+            >>> minibelt.instrument()
+            >>> minibelt.slugify('Foo Bar')
+            'foo-bar'
+            >>> list(minibelt.chunks(range(5), 2))
+            [(0, 1), (2, 3), (4,)]
+            >>> stats = minibelt.stats()
+            >>> stats['slugify']['calls'], stats['chunks']['items']
+            (1, 3)
+            >>> minibelt.instrument(False)
+            >>> minibelt.reset_stats()
+
+        Only the helpers returning an iterator by design get their items
+        counted, the values they return are otherwise left as they are:
+
+            >>> import io
+            >>> minibelt.instrument()
+            >>> f = io.StringIO('foo')
+            >>> minibelt.get({'file': f}, 'file') is f
+            True
+            >>> minibelt.instrument(False)
+            >>> minibelt.reset_stats()
+
+        The public methods of Slugifier, Writer and LazyImport are
+        replaced on the classes and recorded as "Class.method":
+
+            >>> minibelt.instrument()
+            >>> minibelt.Slugifier()('Foo Bar')
+            'foo-bar'
+            >>> sorted(minibelt.stats())
+            ['Slugifier.__call__']
+            >>> minibelt.instrument(False)
+            >>> minibelt.reset_stats()
+
+        `names` restricts the instrumentation to some of these functions
+        and classes. It's on by default if the MINIBELT_INSTRUMENT
+        environment variable is set to "1".
+
+        instrument(False) puts the original functions back, so there is no
+        overhead at all. Since the module globals are replaced, only the code
+        using "minibelt.name" sees the change, not the names previously
+        imported with "from minibelt import name". Only the calls from your
+        code are recorded: when a helper uses other helpers, the time is
+        counted for the helper you called only.
+    """
+    g = globals()
+
+    if not enable:
+        for name, func in _instrumented.items():
+            if '.' in name:
+                cls, method = name.split('.')
+                setattr(g[cls], method, func)
+            else:
+                g[name] = func
+        _instrumented.clear()
+        return
+
+    for name in names or __all__:
+        obj = g.get(name)
+        if (name in _instrumented or name in _NOT_INSTRUMENTED or
+                not callable(obj) or isinstance(obj, type)):
+            continue
+        _instrumented[name] = obj
+        count_items = (name in _ITERATOR_HELPERS or
+                       inspect.isgeneratorfunction(obj))
+        g[name] = _instrument_function(name, obj, count_items)
+
+    for cls, methods in _INSTRUMENTED_METHODS.items():
+        if names and cls not in names:
+            continue
+        for method in methods:
+            name = '%s.%s' % (cls, method)
+            if name in _instrumented:
+                continue
+            func = _instrumented[name] = g[cls].__dict__[method]
+            setattr(g[cls], method, _instrument_function(
+                name, func, name in _ITERATOR_HELPERS))
+
+
+def stats():
+    """
+        Return a dict of the figures recorded by instrument(), such as:
+
+            {'slugify': {'calls': 1000, 'items': 0, 'time': 0.0021}}
+
+        'time' is in seconds, and 'items' only counts the items yielded by
+        helpers returning an iterator.
+    """
+    return dict((name, dict(record)) for name, record in _stats.items()
+                if record['calls'])
+
+
+def reset_stats():
+    """
+        Set all the figures recorded by instrument() back to zero.
+    """
+    for record in _stats.values():
+        record.update(calls=0, items=0, time=0.)
+
+
+if os.environ.get('MINIBELT_INSTRUMENT') == '1':
+    instrument()
+
+
+
+if __name__ == '__main__':
+    # the benchmarks are in bench_minibelt.py, which is not installed with
+    # the module, so "python -m minibelt bench" works from the repository
+    try:
+        from bench_minibelt import main
+    except ImportError:
+        sys.exit('Run it from the minibelt repository to get bench_minibelt.py')
+    sys.exit(main())